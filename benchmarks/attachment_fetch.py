@@ -0,0 +1,53 @@
+# Attachment download + Tika extraction: one at a time vs the concurrent fetch_documents stage
+# Serves the rfp_test_samples texts from a local HTTP server that adds a fixed latency per request,
+# standing in for the SAM.gov attachment host. Needs the Tika server like step 2 does.
+# The attachment cache is off: every run downloads and extracts every attachment.
+# Run from the repo root: python -m benchmarks.attachment_fetch
+import os
+import time
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from elastic_search import index_pdf_and_docs
+from elastic_search.index_pdf_and_docs import fetch_documents
+
+samples_folder = "summarizer/rfp_test_samples"
+latency = 0.5 # seconds before the server answers, SAM.gov attachments are rarely faster
+notices = 20
+links_per_notice = 3
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+def fake_opportunities(base_url):
+    files = [f"{sample}/sample_text.txt" for sample in sorted(os.listdir(samples_folder))]
+    opps = []
+    for i in range(notices):
+        links = [f"{base_url}/{files[(i + j) % len(files)]}?n={i}" for j in range(links_per_notice)]
+        opps.append({"noticeId": f"notice-{i}", "uiLink": f"{base_url}/notice-{i}", "resourceLinks": links})
+    return opps
+
+def run(opps, workers):
+    start = time.perf_counter()
+    total_chars = 0
+    for _, texts in fetch_documents(opps, workers=workers):
+        total_chars += sum(len(t) for t in texts)
+    return time.perf_counter() - start, total_chars
+
+if __name__ == "__main__":
+    index_pdf_and_docs.attachment_cache = None # otherwise the second run is served from the first one's cache
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(SlowHandler, directory=samples_folder))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    opps = fake_opportunities(f"http://127.0.0.1:{server.server_address[1]}")
+
+    print(f"{notices} notices x {links_per_notice} attachments, {latency}s latency per download")
+    for workers in (1, index_pdf_and_docs.FETCH_WORKERS):
+        seconds, chars = run(opps, workers)
+        print(f"workers={workers}: {seconds:.2f}s ({chars} chars extracted)")
+
+    server.shutdown()
@@ -0,0 +1,91 @@
+# Browser path: the old single tab with a fixed 7s sleep per page vs BrowserPool (several tabs, WebDriverWait on #desc)
+# Serves pages shaped like SAM.gov notice pages from a local HTTP server: #desc is filled in by script after
+# a random delay, #links-attachments holds the attachment links, and some pages show a captcha the first time.
+# Needs Chrome (headless here). Run from the repo root: python -m benchmarks.browser_pool
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from elastic_search.extraction_sources.browser_pool import BrowserPool, BROWSER_TABS
+
+notices = 40
+old_path_notices = 5 # the fixed sleep path is timed on a few pages and extrapolated
+captcha_share = 0.1
+render_delay = (0.3, 2.0) # seconds before #desc gets its text
+
+PAGE = """<html><body>
+<div id="desc"></div>
+<div id="links-attachments"><a href="/files/{notice_id}/sow.pdf">sow.pdf</a><a href="/files/{notice_id}/pricing.xlsx">pricing.xlsx</a></div>
+<script>setTimeout(function () {{
+  document.getElementById("desc").textContent = "Notice {notice_id}: the contractor shall provide services.";
+}}, {delay_ms});</script>
+</body></html>"""
+CAPTCHA_PAGE = "<html><body><p>Our systems have detected unusual traffic from your computer network</p></body></html>"
+
+class MockNoticeHandler(BaseHTTPRequestHandler):
+    captcha_shown = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        notice_id = self.path.strip("/").split("/")[-1]
+        rng = random.Random(notice_id)
+        with self.lock:
+            captcha = rng.random() < captcha_share and notice_id not in self.captcha_shown
+            self.captcha_shown.add(notice_id)
+        if captcha:
+            body = CAPTCHA_PAGE
+        else:
+            body = PAGE.format(notice_id=notice_id, delay_ms=int(rng.uniform(*render_delay) * 1000))
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def headless_tab():
+    options = Options()
+    options.add_argument("--headless=new")
+    return webdriver.Chrome(options=options)
+
+def fake_opportunities(base_url, count):
+    return [{"noticeId": f"n{i}", "uiLink": f"{base_url}/opp/n{i}", "resourceLinks": []} for i in range(count)]
+
+def old_path(driver, opps):
+    for item in opps:
+        driver.get(item["uiLink"])
+        time.sleep(7)
+        item["description"] = driver.find_element(By.ID, "desc").text.strip()
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockNoticeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    driver = headless_tab()
+    start = time.perf_counter()
+    old_path(driver, fake_opportunities(base_url, old_path_notices))
+    per_page = (time.perf_counter() - start) / old_path_notices
+    driver.quit()
+    print(f"single tab, 7s sleep: {per_page:.2f}s per page, ~{per_page * notices:.0f}s for {notices} pages")
+
+    for tabs in (1, BROWSER_TABS):
+        MockNoticeHandler.captcha_shown = set()
+        opps = fake_opportunities(base_url, notices)
+        pool = BrowserPool(headless_tab, tabs=tabs)
+        start = time.perf_counter()
+        pool.scrape(opps)
+        elapsed = time.perf_counter() - start
+        for d in pool.drivers:
+            d.quit()
+        described = sum(1 for item in opps if item.get("description"))
+        print(f"BrowserPool tabs={tabs}: {elapsed:.1f}s for {notices} pages, {described} descriptions, "
+              f"{sum(len(item['resourceLinks']) for item in opps)} attachment links")
+
+    server.shutdown()
@@ -0,0 +1,97 @@
+# Bulk indexing: the old helpers.bulk every 3 documents vs bulk_index (byte/count batching, threads, 429 retries)
+# Runs against a local stand-in for the ES _bulk endpoint that charges a fixed cost per request plus
+# a cost per MB, and rejects a share of documents with 429 the first time it sees them.
+# Run from the repo root: python -m benchmarks.bulk_index
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from elasticsearch import Elasticsearch, helpers
+from elastic_search import index_pdf_and_docs
+from elastic_search.index_pdf_and_docs import bulk_index, INDEX_NAME
+
+request_latency = 0.02 # seconds per bulk request
+seconds_per_mb = 0.01
+reject_share = 0.05 # documents answered with 429 on their first attempt
+small_docs = 2000
+large_docs = 40 # notices with a 1 MB pdf_text chunk
+
+class FakeBulkHandler(BaseHTTPRequestHandler):
+    seen = set()
+    lock = threading.Lock()
+    requests = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        lines = body.splitlines()
+        items = []
+        errors = False
+        for meta_line in lines[0::2]:
+            meta = json.loads(meta_line)["index"]
+            with self.lock:
+                first_time = meta["_id"] not in self.seen
+                self.seen.add(meta["_id"])
+            if first_time and random.random() < reject_share:
+                items.append({"index": {"_index": meta["_index"], "_id": meta["_id"], "status": 429, "error": {"type": "es_rejected_execution_exception"}}})
+                errors = True
+            else:
+                items.append({"index": {"_index": meta["_index"], "_id": meta["_id"], "status": 201}})
+        with self.lock:
+            FakeBulkHandler.requests += 1
+        time.sleep(request_latency + seconds_per_mb * len(body) / 1024 / 1024)
+
+        response = json.dumps({"took": 1, "errors": errors, "items": items}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.elasticsearch+json;compatible-with=8")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    do_PUT = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+def fake_actions(run):
+    rng = random.Random(0)
+    docs = [{"title": f"notice {i}", "description_text": "x" * 1000} for i in range(small_docs)]
+    docs += [{"title": f"large notice {i}", "pdfs": [{"pdf_url": "u", "pdf_title": "t", "pdf_text": "y" * 1_000_000}]} for i in range(large_docs)]
+    rng.shuffle(docs)
+    for i, doc in enumerate(docs):
+        yield {"_index": INDEX_NAME, "_id": f"{run}-{i}", "_source": doc}
+
+def old_path(es, actions):
+    # What index_rfps did before: a bulk request every 3 documents, no retries
+    batch = []
+    for action in actions:
+        batch.append(action)
+        if len(batch) >= 3:
+            helpers.bulk(es, batch, raise_on_error=False)
+            batch = []
+    if batch:
+        helpers.bulk(es, batch, raise_on_error=False)
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBulkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    es = Elasticsearch(f"http://127.0.0.1:{server.server_address[1]}")
+
+    total_mb = (small_docs * 1000 + large_docs * 1_000_000) / 1024 / 1024
+    print(f"{small_docs + large_docs} docs, ~{total_mb:.0f} MB")
+
+    FakeBulkHandler.requests = 0
+    start = time.perf_counter()
+    old_path(es, fake_actions("old"))
+    elapsed = time.perf_counter() - start
+    print(f"every 3 docs: {elapsed:.1f}s, {FakeBulkHandler.requests} requests, {total_mb / elapsed:.2f} MB/s (429s dropped)")
+
+    for threads in (1, index_pdf_and_docs.BULK_THREADS):
+        FakeBulkHandler.requests = 0
+        start = time.perf_counter()
+        bulk_index(es, fake_actions(f"new-{threads}"), threads=threads)
+        elapsed = time.perf_counter() - start
+        print(f"bulk_index threads={threads}: {elapsed:.1f}s, {FakeBulkHandler.requests} requests (429s retried)")
+
+    server.shutdown()
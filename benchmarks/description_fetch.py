@@ -0,0 +1,72 @@
+# Notice descriptions: one request at a time (expand_descriptions.py) vs fill_descriptions, and what the
+# browser path costs for the same notices. Runs against a local mock of the noticedesc endpoint that adds a
+# fixed latency per request and has no description for a share of notices (those fall back to the browser).
+# Run from the repo root: python -m benchmarks.description_fetch
+import json
+import time
+import random
+import threading
+import requests
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from elastic_search.extraction_sources import sam_gov_api
+from elastic_search.extraction_sources.sam_gov_api import fill_descriptions
+
+latency = 0.3 # seconds per description request
+missing_share = 0.05 # notices without a description behind the link
+notices = 200
+browser_seconds = 7 # fixed sleep per page in the browser path, page load not included
+
+class MockDescriptionHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        notice_id = parse_qs(urlparse(self.path).query)["noticeid"][0]
+        time.sleep(latency)
+        if random.Random(notice_id).random() < missing_share:
+            body = json.dumps({"error": "Description Not Found"}).encode("utf-8")
+            self.send_response(404)
+        else:
+            description = f"<p>Notice {notice_id}: the contractor shall provide&nbsp;services.</p>" * 20
+            body = json.dumps({"description": description}).encode("utf-8")
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def fake_opportunities(base_url):
+    return [
+        {"noticeId": f"n{i}", "description": f"{base_url}/prod/opportunities/v1/noticedesc?noticeid=n{i}", "resourceLinks": None}
+        for i in range(notices)
+    ]
+
+def serial(opps):
+    # What expand_descriptions.py does, minus its 1s throttle
+    for item in opps:
+        r = requests.get(item["description"], params={"api_key": "key"}, timeout=15)
+        item["description_text"] = r.text
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockDescriptionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{notices} notices, {latency}s per description request")
+    print(f"browser path: >= {notices * browser_seconds}s ({browser_seconds}s sleep per page)")
+
+    start = time.perf_counter()
+    serial(fake_opportunities(base_url))
+    elapsed = time.perf_counter() - start
+    print(f"one request at a time: {elapsed:.1f}s, {notices / elapsed:.1f} notices/s")
+
+    start = time.perf_counter()
+    opps = fake_opportunities(base_url)
+    browser_opps = fill_descriptions(opps, "key")
+    elapsed = time.perf_counter() - start
+    print(f"fill_descriptions workers={sam_gov_api.DESCRIPTION_WORKERS}: {elapsed:.1f}s, {notices / elapsed:.1f} notices/s, "
+          f"{len(browser_opps)} left for the browser (>= {len(browser_opps) * browser_seconds}s)")
+    print(f"sample: {opps[0]['description'][:80]}")
+
+    server.shutdown()
@@ -0,0 +1,76 @@
+# Embedding backends: encoding speed (passages/s) of each backend in embedding_backends.py on the
+# rfp_test_samples passages, how close their vectors are to the float32 "torch" backend, and whether the
+# summaries they lead to select the same passages. Louvain is seeded for the comparison, so differences
+# come from the embeddings only. Backends whose packages are not installed are skipped.
+# Run from the repo root: python -m benchmarks.embedding_backends [threads] [batch_size]
+import os
+import sys
+import time
+import functools
+import numpy as np
+import community as community_louvain
+from summarizer import summarizer
+from summarizer.embedding_backends import BACKENDS, load_backend
+from summarizer.summarizer import normalize_text, split_passages, deduplicate, summarize_passages, summary_weights
+
+samples_folder = "summarizer/rfp_test_samples"
+min_cosine = 0.98 # mean cosine similarity to the torch vectors
+min_summary_overlap = 0.8 # Jaccard overlap of the selected passages with the torch summary
+
+def load_samples():
+    samples = []
+    for sample in sorted(os.listdir(samples_folder)):
+        with open(os.path.join(samples_folder, sample, "sample_text.txt"), "r", encoding="utf-8") as r:
+            text = normalize_text(r.read())
+        with open(os.path.join(samples_folder, sample, "title.txt"), "r", encoding="utf-8") as r:
+            title = r.read()
+        passages, counts, money_passages, money_counts = deduplicate(*split_passages(text))
+        samples.append((sample, title, len(text), passages, counts, money_passages, money_counts))
+    return samples
+
+def summary_passages(backend, sample):
+    _, title, text_length, passages, counts, money_passages, money_counts = sample
+    title_vector = backend.encode(title, normalize_embeddings=True)
+    title_weight, description_weight, aspect_weight = summary_weights(None)
+    summary = summarize_passages(
+        text_length, passages, money_passages, backend.encode(passages), backend.encode(money_passages),
+        title_vector, None, title_weight, description_weight, aspect_weight, summarizer.graph_mode, counts, money_counts
+    )
+    return set(summary.split("\n"))
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else summarizer.encode_batch_size
+    community_louvain.best_partition = functools.partial(community_louvain.best_partition, random_state=0)
+
+    samples = load_samples()
+    passages = [passage for sample in samples for passage in sample[3]]
+    print(f"{len(passages)} passages from {len(samples)} samples | threads={threads or 'default'} | batch_size={batch_size}")
+
+    reference = None
+    for name in BACKENDS:
+        try:
+            start = time.perf_counter()
+            backend = load_backend(name, summarizer.model_name, threads, batch_size)
+            load_seconds = time.perf_counter() - start
+        except ImportError as e:
+            print(f"{name}: skipped ({e})")
+            continue
+
+        start = time.perf_counter()
+        embeddings = backend.encode(passages)
+        encode_seconds = time.perf_counter() - start
+        line = f"{name}: load {load_seconds:.1f}s | {len(passages) / encode_seconds:.0f} passages/s"
+
+        summaries = [summary_passages(backend, sample) for sample in samples]
+        if reference is None:
+            reference = (embeddings, summaries)
+            print(line + " (reference)")
+            continue
+
+        unit, reference_unit = summarizer._unit_rows(embeddings), summarizer._unit_rows(reference[0])
+        cosine = np.sum(unit * reference_unit, axis=1)
+        overlaps = [len(a & b) / max(len(a | b), 1) for a, b in zip(summaries, reference[1])]
+        ok = cosine.mean() >= min_cosine and min(overlaps) >= min_summary_overlap
+        print(f"{line} | cosine to torch mean {cosine.mean():.4f} min {cosine.min():.4f} | "
+              f"summary overlap {', '.join(f'{o:.2f}' for o in overlaps)} | {'OK' if ok else 'OUTSIDE TOLERANCE'}")
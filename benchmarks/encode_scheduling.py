@@ -0,0 +1,71 @@
+# Encoding throughput (passages/s) on the rfp_test_samples: the old per-document calls (passages, money
+# passages, title and description each in their own model.encode with fixed batches) vs one scheduled call
+# per document and one across all documents (length-sorted batches sized by the token budget).
+# The embedding cache is off so every text is encoded. Also checks the scheduled vectors match the old ones.
+# Run from the repo root: python -m benchmarks.encode_scheduling [token_budget]
+import os
+import sys
+import time
+import numpy as np
+from summarizer import summarizer
+from summarizer.summarizer import normalize_text, split_passages, deduplicate, encode_batches, ScheduledEncoder
+
+samples_folder = "summarizer/rfp_test_samples"
+repeats = 3
+
+def load_samples():
+    samples = []
+    for sample in sorted(os.listdir(samples_folder)):
+        with open(os.path.join(samples_folder, sample, "sample_text.txt"), "r", encoding="utf-8") as r:
+            text = normalize_text(r.read())
+        with open(os.path.join(samples_folder, sample, "title.txt"), "r", encoding="utf-8") as r:
+            title = r.read()
+        passages, _, money_passages, _ = deduplicate(*split_passages(text))
+        samples.append((title, text[:500], passages, money_passages))
+    return samples
+
+def separate_calls(model, samples):
+    for title, description, passages, money_passages in samples:
+        model.encode(title, normalize_embeddings=True)
+        model.encode(description, normalize_embeddings=True)
+        model.encode(passages)
+        model.encode(money_passages)
+
+def per_document(encoder, samples):
+    for title, description, passages, money_passages in samples:
+        encoder.encode([title, description] + passages + money_passages)
+
+def across_documents(encoder, samples):
+    encoder.encode([text for title, description, passages, money_passages in samples for text in [title, description] + passages + money_passages])
+
+def best_seconds(function, *args):
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+if __name__ == "__main__":
+    token_budget = int(sys.argv[1]) if len(sys.argv) > 1 else summarizer.get_token_budget()
+    summarizer.embedding_cache = None
+    model = summarizer.get_model()
+    encoder = ScheduledEncoder(model, token_budget)
+
+    samples = load_samples()
+    texts = [text for title, description, passages, money_passages in samples for text in [title, description] + passages + money_passages]
+    batches = encode_batches(texts, token_budget)
+    print(f"{len(texts)} texts from {len(samples)} samples | token budget {token_budget} | "
+          f"{len(batches)} batches of {min(map(len, batches))}-{max(map(len, batches))} texts")
+
+    model.encode(texts[:64]) # warm up
+    for name, function, encode_with in (
+        ("separate calls", separate_calls, model),
+        ("scheduled per document", per_document, encoder),
+        ("scheduled across documents", across_documents, encoder),
+    ):
+        seconds = best_seconds(function, encode_with, samples)
+        print(f"{name}: {seconds:.2f}s | {len(texts) / seconds:.0f} passages/s")
+
+    difference = np.abs(encoder.encode(texts) - model.encode(texts)).max()
+    print(f"max difference to unscheduled vectors: {difference:.2e}")
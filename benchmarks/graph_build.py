@@ -0,0 +1,70 @@
+# Graph construction benchmark: dense matrix + python double loop vs blocked similarity_edges
+# Run from the repo root: python -m benchmarks.graph_build
+import sys
+import time
+import numpy as np
+import networkx as nx
+from summarizer.summarizer import similarity_edges, build_similarity_graph_from_embeddings
+
+sizes = [1000, 2000, 5000, 10000, 20000, 50000]
+dim = 384 # all-MiniLM-L6-v2 embedding size
+legacy_max_size = 5000 # the old loop takes minutes and n*n memory past this
+edge_percentile = 90
+
+def legacy_graph(embeddings, edge_percentile=edge_percentile):
+    n = len(embeddings)
+    G = nx.Graph()
+    G.add_nodes_from(range(n))
+
+    sim_matrix = np.dot(embeddings, embeddings.T)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    sim_matrix /= (norms @ norms.T)
+    np.fill_diagonal(sim_matrix, 0.0)
+
+    triu = sim_matrix[np.triu_indices(n, k=1)]
+    valid = triu[triu > 0]
+    if valid.size == 0:
+        return G
+
+    threshold = np.percentile(valid, edge_percentile)
+    for i in range(n):
+        for j in range(i+1, n):
+            if sim_matrix[i, j] >= threshold:
+                G.add_edge(i, j, weight=float(sim_matrix[i, j]))
+    return G
+
+def fake_embeddings(n, topics=50, seed=0):
+    # Passages drawn around a few topic centers, so the similarity distribution looks like a real RFP
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    labels = rng.integers(0, topics, n)
+    return centers[labels] + 1.5 * rng.standard_normal((n, dim)).astype(np.float32)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        edge_percentile = float(sys.argv[1])
+
+    print(f"Edge%={edge_percentile} | dim={dim}")
+    print(f"{'passages':>9} {'edges':>12} {'edges (s)':>10} {'graph (s)':>10} {'legacy (s)':>11}")
+    for n in sizes:
+        embeddings = fake_embeddings(n)
+
+        start = time.perf_counter()
+        rows, cols, sims = similarity_edges(embeddings, edge_percentile)
+        edges_time = time.perf_counter() - start
+
+        # networkx itself needs ~1 KB per edge, so only build the graph when it fits
+        graph_time = float("nan")
+        if len(rows) <= 20_000_000:
+            start = time.perf_counter()
+            build_similarity_graph_from_embeddings(embeddings, edge_percentile)
+            graph_time = time.perf_counter() - start
+
+        legacy_time = float("nan")
+        if n <= legacy_max_size:
+            start = time.perf_counter()
+            legacy_graph(embeddings, edge_percentile)
+            legacy_time = time.perf_counter() - start
+
+        print(f"{n:>9} {len(rows):>12} {edges_time:>10.2f} {graph_time:>10.2f} {legacy_time:>11.2f}")
+        del rows, cols, sims
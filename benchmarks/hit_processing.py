@@ -0,0 +1,81 @@
+# Client-side post-processing of a search response: the old keywords x fragments `in` checks vs
+# results_from_response with KeywordMatcher, on a synthetic size=500 response (highlights on the notice
+# fields and on several nested pdfs per hit) built from the rfp_test_samples texts. No Elasticsearch needed.
+# Run from the repo root: python -m benchmarks.hit_processing
+import os
+import time
+import random
+from elastic_search import main as search
+
+samples_folder = "summarizer/rfp_test_samples"
+hits = 500
+pdfs_per_hit = 5
+fragments_per_field = 3
+keyword_counts = [5, 20, 50]
+repeats = 5
+
+def sample_words():
+    words = []
+    for sample in sorted(os.listdir(samples_folder)):
+        with open(os.path.join(samples_folder, sample, "sample_text.txt"), "r", encoding="utf-8") as r:
+            words.extend(r.read().split())
+    return words
+
+def fake_response(words, keywords, rng):
+    def fragment():
+        start = rng.randrange(len(words) - 40)
+        text = words[start:start + 30]
+        if rng.random() < 0.5:
+            text.insert(rng.randrange(len(text)), f"<em>{rng.choice(keywords)}</em>")
+        return " ".join(text)
+
+    response_hits = []
+    for i in range(hits):
+        response_hits.append({
+            "_source": {"noticeId": f"n{i}", "title": f"Notice {i}", "pointOfContact": [{"fullName": "A B", "email": "a@b.gov"}]},
+            "highlight": {
+                "title": [fragment()],
+                "description_text": [fragment() for _ in range(fragments_per_field)],
+            },
+            "inner_hits": {"pdfs": {"hits": {"hits": [
+                {"_source": {"pdf_title": f"attachment_{j}.pdf", "pdf_url": f"https://sam.gov/n{i}/{j}"},
+                 "highlight": {"pdfs.pdf_text": [fragment() for _ in range(fragments_per_field)]}}
+                for j in range(pdfs_per_hit)
+            ]}}},
+        })
+    return {"hits": {"hits": response_hits}}
+
+class OldMatcher:
+    # The loop results_from_response had before KeywordMatcher
+    def __init__(self, keywords):
+        self.keywords = keywords
+
+    def matches(self, fragments, matched=()):
+        return [kw for kw in self.keywords if any(kw.lower() in frag.lower() for frag in fragments)]
+
+def timed(keywords, response):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = search.results_from_response(response, keywords)
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+if __name__ == "__main__":
+    words = sample_words()
+    rng = random.Random(0)
+    vocabulary = sorted({w.strip(".,;:()").lower() for w in words if len(w) > 5})
+    for count in keyword_counts:
+        keywords = rng.sample(vocabulary, count - 2) + ["Software Maintenance", "cloud migration"]
+        response = fake_response(words, keywords, rng)
+
+        matcher = search.KeywordMatcher
+        search.KeywordMatcher = OldMatcher
+        old_seconds, old_results = timed(keywords, response)
+        search.KeywordMatcher = matcher
+        new_seconds, new_results = timed(keywords, response)
+
+        same = [r["relevant_keywords"] for r in old_results] == [r["relevant_keywords"] for r in new_results]
+        print(f"{count} keywords, {hits} hits x {1 + pdfs_per_hit} highlighted fields: "
+              f"old {old_seconds * 1000:.1f}ms | KeywordMatcher {new_seconds * 1000:.1f}ms "
+              f"({old_seconds / new_seconds:.1f}x), same keywords: {same}")
@@ -0,0 +1,47 @@
+# Percentile graph vs knn graph: cluster agreement on the rfp_test_samples and scaling on synthetic passages
+# Run from the repo root: python -m benchmarks.knn_graph
+import os
+import time
+import numpy as np
+from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
+from summarizer import summarizer
+from summarizer.summarizer import normalize_text, split_passages, build_similarity_graph_from_embeddings, cluster_graph, knn_edges, similarity_edges
+from benchmarks.graph_build import fake_embeddings
+
+samples_folder = "summarizer/rfp_test_samples"
+sizes = [5000, 10000, 20000, 50000]
+
+def cluster_labels(embeddings, graph_mode):
+    G = build_similarity_graph_from_embeddings(embeddings, graph_mode=graph_mode)
+    labels = np.empty(len(embeddings), dtype=np.int64)
+    for cid, cluster in enumerate(cluster_graph(G)):
+        labels[cluster] = cid
+    return labels
+
+if __name__ == "__main__":
+    print(f"knn_k={summarizer.knn_k} | mutual={summarizer.knn_mutual} | nprobe={summarizer.ivf_nprobe}")
+
+    for sample in sorted(os.listdir(samples_folder)):
+        with open(os.path.join(samples_folder, sample, "sample_text.txt"), "r", encoding="utf-8") as r:
+            text = normalize_text(r.read())
+        passages, _ = split_passages(text)
+        embeddings = summarizer.get_model().encode(passages, convert_to_numpy=True, show_progress_bar=False)
+
+        exact = cluster_labels(embeddings, "percentile")
+        knn = cluster_labels(embeddings, "knn")
+        print(f"{sample}: {len(passages)} passages | ARI={adjusted_rand_score(exact, knn):.3f} | NMI={normalized_mutual_info_score(exact, knn):.3f}")
+
+    print(f"\n{'passages':>9} {'percentile (s)':>15} {'knn (s)':>8}")
+    for n in sizes:
+        embeddings = fake_embeddings(n)
+
+        start = time.perf_counter()
+        knn_edges(embeddings)
+        knn_time = time.perf_counter() - start
+
+        # Keep the percentile edge list small enough to fit in memory at 50k
+        start = time.perf_counter()
+        similarity_edges(embeddings, edge_percentile=99)
+        percentile_time = time.perf_counter() - start
+
+        print(f"{n:>9} {percentile_time:>15.2f} {knn_time:>8.2f}")
@@ -0,0 +1,58 @@
+# normalize_text: the old seven-pass cleanup vs the current one. Checks the output is identical on the
+# rfp_test_samples texts and on random strings mixing symbols, whitespace, controls, non-ASCII and lone
+# surrogates, then compares throughput in MB/s on the samples repeated up to about 20 MB (one large notice).
+# Run from the repo root: python -m benchmarks.normalize_text
+import os
+import re
+import time
+import random
+from summarizer.summarizer import normalize_text
+
+samples_folder = "summarizer/rfp_test_samples"
+target_mb = 20
+random_strings = 20000
+repeats = 3
+
+def normalize_text_reference(text):
+    # normalize_text before the single-pass rewrite
+    text = text.encode("utf-8", "ignore").decode("utf-8", "ignore")
+    text = re.sub(r"[^\x09\x0A\x0D\x20-\x7E]", " ", text)
+    text = re.sub(r"[\n\r\t]+", " ", text)
+    text = text.lower()
+    text = re.sub(r"([^\w\s])\1{2,}", " ", text)
+    text = re.sub(r"\b[^\w\s]{2,}\b", " ", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip()
+
+def random_text(rng):
+    alphabet = "aZ9_ .-$#!!\t\n\r\x0b\x00\x7f\xa0é€ \ud800ΣİK"
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+
+def throughput(function, text):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(text)
+        best = min(best, time.perf_counter() - start)
+    return len(text.encode("utf-8", "ignore")) / 1e6 / best
+
+if __name__ == "__main__":
+    texts = []
+    for sample in sorted(os.listdir(samples_folder)):
+        with open(os.path.join(samples_folder, sample, "sample_text.txt"), "r", encoding="utf-8") as r:
+            texts.append(r.read())
+
+    rng = random.Random(0)
+    mismatches = sum(normalize_text(text) != normalize_text_reference(text) for text in texts)
+    print(f"rfp_test_samples: {len(texts) - mismatches}/{len(texts)} identical")
+    strings = [random_text(rng) for _ in range(random_strings)]
+    mismatches = sum(normalize_text(text) != normalize_text_reference(text) for text in strings)
+    print(f"random strings: {random_strings - mismatches}/{random_strings} identical")
+
+    combined = " | ".join(texts)
+    large = combined * max(1, int(target_mb * 1e6 // len(combined)))
+    print(f"\n{len(large) / 1e6:.1f} MB of sample text")
+    for name, text in [("as extracted", large), ("ASCII only", large.encode("ascii", "ignore").decode("ascii"))]:
+        old = throughput(normalize_text_reference, text)
+        new = throughput(normalize_text, text)
+        print(f"{name}: old {old:.1f} MB/s | normalize_text {new:.1f} MB/s ({new / old:.1f}x)")
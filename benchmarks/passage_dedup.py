@@ -0,0 +1,38 @@
+# Passage deduplication: passages removed by deduplicate_passages (exact / near duplicates) and the encoding
+# time saved, on the rfp_test_samples and on a synthetic multi-amendment notice (the sample followed by
+# amendment copies with a few words changed). Loads the sentence-transformers model.
+# Run from the repo root: python -m benchmarks.passage_dedup
+import os
+import time
+import random
+from summarizer import summarizer
+from summarizer.summarizer import normalize_text, split_passages, deduplicate_passages
+
+samples_folder = "summarizer/rfp_test_samples"
+amendments = 3
+changed_words = 0.02 # share of words edited in each amendment copy
+
+def timed_encode(passages):
+    model = summarizer.get_model()
+    start = time.perf_counter()
+    model.encode(passages, convert_to_numpy=True, show_progress_bar=False)
+    return time.perf_counter() - start
+
+def report(name, text):
+    passages, _ = split_passages(normalize_text(text))
+    start = time.perf_counter()
+    kept, counts, exact, near = deduplicate_passages(passages)
+    dedup_seconds = time.perf_counter() - start
+    print(f"{name}: {len(passages)} passages >>> {len(kept)} ({exact} exact, {near} near) in {dedup_seconds:.2f}s | "
+          f"encode {timed_encode(passages):.1f}s >>> {timed_encode(kept):.1f}s")
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    for sample in sorted(os.listdir(samples_folder)):
+        with open(os.path.join(samples_folder, sample, "sample_text.txt"), "r", encoding="utf-8") as r:
+            text = r.read()
+        report(sample, text)
+
+    words = text.split()
+    copies = [" ".join("amended" if rng.random() < changed_words else word for word in words) for _ in range(amendments)]
+    report(f"{sample} + {amendments} amendments", "\n".join([text] + copies))
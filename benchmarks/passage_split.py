@@ -0,0 +1,57 @@
+# Passage splitting: the fixed 300-char cut with a MONEY_REGEX.search per passage vs passage_spans
+# (sentence / word boundaries, one MONEY_REGEX pass, spans instead of strings), on the normalized
+# rfp_test_samples repeated up to about 20 MB. Also counts the money amounts each splitter cuts in two.
+# Run from the repo root: python -m benchmarks.passage_split
+import os
+import time
+from summarizer import summarizer
+from summarizer.summarizer import normalize_text, passage_spans, split_passages, MONEY_REGEX
+
+samples_folder = "summarizer/rfp_test_samples"
+target_mb = 20
+overlaps = [0, 50]
+repeats = 3
+
+def fixed_spans(text, length=summarizer.length):
+    return [(i, min(i + length, len(text))) for i in range(0, len(text), length)]
+
+def amounts_cut(text, spans):
+    # Amounts not inside any single passage
+    ends = sorted(spans)
+    cut = 0
+    i = 0
+    for match in MONEY_REGEX.finditer(text):
+        while i < len(ends) and ends[i][1] <= match.start():
+            i += 1
+        if not any(s <= match.start() and match.end() <= e for s, e in ends[i:i + 3]):
+            cut += 1
+    return cut
+
+def timed(function):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+if __name__ == "__main__":
+    texts = []
+    for sample in sorted(os.listdir(samples_folder)):
+        with open(os.path.join(samples_folder, sample, "sample_text.txt"), "r", encoding="utf-8") as r:
+            texts.append(normalize_text(r.read()))
+    combined = " ".join(texts)
+    text = " ".join([combined] * max(1, int(target_mb * 1e6 // len(combined))))
+    print(f"{len(text) / 1e6:.1f} MB of normalized text, {sum(1 for _ in MONEY_REGEX.finditer(text))} money amounts")
+
+    summarizer.passage_split = "fixed"
+    seconds, (passages, money_passages) = timed(lambda: split_passages(text))
+    print(f"fixed split_passages: {seconds:.2f}s | {len(passages)} passages, {len(money_passages)} money | "
+          f"{amounts_cut(text, fixed_spans(text))} amounts cut")
+
+    summarizer.passage_split = "sentence"
+    for overlap in overlaps:
+        seconds, (spans, money_spans) = timed(lambda: passage_spans(text, overlap=overlap))
+        strings_seconds, _ = timed(lambda: split_passages(text, overlap=overlap))
+        print(f"passage_spans overlap={overlap}: {seconds:.2f}s spans, {strings_seconds:.2f}s as strings | "
+              f"{len(spans)} passages, {len(money_spans)} money | {amounts_cut(text, spans + money_spans)} amounts cut")
@@ -0,0 +1,101 @@
+# SAM.gov search: the old single request (limit=1000, offset=0) vs fetch_opportunities
+# Runs against a local mock of /opportunities/v2/search with a fixed latency per request that
+# answers a share of requests with 429 / 503 and hangs on a few others.
+# Run from the repo root: python -m benchmarks.sam_gov_fetch
+import json
+import time
+import random
+import threading
+from datetime import date, datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+from elastic_search.extraction_sources import sam_gov_api
+from elastic_search.extraction_sources.sam_gov_api import fetch_opportunities
+
+latency = 0.3 # seconds per search request
+error_share = 0.15 # requests answered with 429 or 503
+hang_share = 0.03 # requests that never answer in time
+notices_per_day = 60
+days = 90
+
+today = date.today()
+notices = [
+    {"noticeId": f"notice-{day}-{i}", "postedDate": str(today - timedelta(days=day)), "title": f"notice {day}/{i}"}
+    for day in range(days + 1) for i in range(notices_per_day)
+]
+
+class MockSearchHandler(BaseHTTPRequestHandler):
+    requests = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            MockSearchHandler.requests += 1
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        roll = random.random()
+        if roll < hang_share:
+            time.sleep(3)
+            return
+        time.sleep(latency)
+        if roll < hang_share + error_share:
+            self.send_response(random.choice([429, 503]))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        posted_from = datetime.strptime(params["postedFrom"], "%m/%d/%Y").date()
+        posted_to = datetime.strptime(params["postedTo"], "%m/%d/%Y").date()
+        matching = [n for n in notices if posted_from <= date.fromisoformat(n["postedDate"]) <= posted_to]
+        offset, limit = int(params["offset"]), min(int(params["limit"]), 1000)
+        body = json.dumps({"totalRecords": len(matching), "opportunitiesData": matching[offset:offset + limit]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def old_fetch(url, start_date, end_date):
+    params = {
+        "api_key": "key",
+        "postedFrom": start_date.strftime("%m/%d/%Y"),
+        "postedTo": end_date.strftime("%m/%d/%Y"),
+        "ptype": "o",
+        "limit": 1000,
+        "offset": 0
+    }
+    r = requests.get(url, params=params)
+    r.raise_for_status()
+    return r.json()
+
+if __name__ == "__main__":
+    random.seed(0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockSearchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/opportunities/v2/search"
+    start_date = today - timedelta(days=days)
+    sam_gov_api.TIMEOUT = (1, 1) # the mock hangs for 3s
+    sam_gov_api.BACKOFF_BASE = 0.1
+
+    print(f"{len(notices)} notices over {days + 1} days, {latency}s per request")
+    for attempt in range(3):
+        try:
+            start = time.perf_counter()
+            data = old_fetch(url, start_date, today)
+            print(f"single request: {time.perf_counter() - start:.1f}s, {len(data['opportunitiesData'])} notices")
+            break
+        except requests.RequestException as e:
+            print(f"single request: {e}")
+
+    for workers, window_days in ((1, days + 1), (sam_gov_api.API_WORKERS, days + 1), (sam_gov_api.API_WORKERS, 7)):
+        MockSearchHandler.requests = 0
+        start = time.perf_counter()
+        data = fetch_opportunities("key", start_date, today, url=url, workers=workers, window_days=window_days)
+        elapsed = time.perf_counter() - start
+        print(f"fetch_opportunities workers={workers} window_days={window_days}: {elapsed:.1f}s, "
+              f"{len(data['opportunitiesData'])} notices, {MockSearchHandler.requests} requests")
+
+    server.shutdown()
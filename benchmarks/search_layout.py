@@ -0,0 +1,106 @@
+# Search latency: nested pdfs layout (search_rfps) vs chunks layout (search_rfps_chunks)
+# Indexes the same synthetic notices, built from the rfp_test_samples texts, into throwaway bench_* indices
+# in both layouts, then times the same searches against each. Needs Elasticsearch on ES_HOST (step 2 starts it).
+# Run from the repo root: python -m benchmarks.search_layout
+import os
+import time
+import random
+from elasticsearch import helpers
+from elastic_search import main as search
+from elastic_search.chunk_layout import CHUNK_MAPPING, chunk_actions
+from elastic_search.index_pdf_and_docs import build_action
+
+samples_folder = "summarizer/rfp_test_samples"
+notices = 300
+attachments_per_notice = 3
+repeats = 20
+queries = [
+    (["cybersecurity"], "lenient", "or"),
+    (["software maintenance"], "exact", "or"),
+    (["cloud", "migration"], "lenient", "and"),
+    (["training", "not construction"], "lenient", "or"),
+]
+
+NESTED_INDEX = "bench_sam_nested"
+NOTICE_INDEX = "bench_sam_notices"
+CHUNK_INDEX = "bench_sam_chunks"
+
+NESTED_MAPPING = {
+    "settings": {"number_of_shards": 1, "number_of_replicas": 0, "index.highlight.max_analyzed_offset": 1000000},
+    "mappings": {
+        "properties": {
+            "noticeId": {"type": "keyword"},
+            "title": {"type": "text"},
+            "description_text": {"type": "text"},
+            "naicsCode": {"type": "keyword"},
+            "pdfs": {
+                "type": "nested",
+                "properties": {
+                    "pdf_url": {"type": "keyword"},
+                    "pdf_title": {"type": "text"},
+                    "pdf_text": {"type": "text"}
+                }
+            }
+        }
+    }
+}
+
+def fake_notices():
+    texts = []
+    for sample in sorted(os.listdir(samples_folder)):
+        with open(os.path.join(samples_folder, sample, "sample_text.txt"), "r", encoding="utf-8") as r:
+            texts.append(r.read())
+    rng = random.Random(0)
+    for i in range(notices):
+        links = [f"https://sam.gov/files/n{i}/attachment_{j}.pdf" for j in range(attachments_per_notice)]
+        item = {"noticeId": f"n{i}", "title": f"Notice {i}", "description_text": rng.choice(texts)[:2000], "naicsCode": "541512", "resourceLinks": links}
+        yield item, [rng.choice(texts) for _ in links]
+
+def recreate(es, index, mapping):
+    if es.indices.exists(index=index):
+        es.indices.delete(index=index)
+    es.indices.create(index=index, body=mapping)
+
+def load(es):
+    recreate(es, NESTED_INDEX, NESTED_MAPPING)
+    recreate(es, NOTICE_INDEX, {"mappings": {"properties": {"noticeId": {"type": "keyword"}, "naicsCode": {"type": "keyword"}}}})
+    recreate(es, CHUNK_INDEX, CHUNK_MAPPING)
+
+    def actions():
+        for item, texts in fake_notices():
+            nested = build_action(item, texts)
+            notice = build_action(item, texts, with_pdfs=False)
+            nested["_index"], notice["_index"] = NESTED_INDEX, NOTICE_INDEX
+            yield nested
+            yield notice
+            for chunk in chunk_actions(item, texts)[0]:
+                chunk["_index"] = CHUNK_INDEX
+                yield chunk
+
+    helpers.bulk(es, actions(), chunk_size=200, max_chunk_bytes=20 * 1024 * 1024)
+    es.indices.refresh(index=f"{NESTED_INDEX},{NOTICE_INDEX},{CHUNK_INDEX}")
+
+def timed(search_function, keywords, match_type, operator):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = search_function(keywords, match_type=match_type, operator=operator, size=20)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95) - 1], len(results)
+
+if __name__ == "__main__":
+    es = search.es
+    load(es)
+    print(f"{notices} notices x {attachments_per_notice} attachments, "
+          f"{es.count(index=CHUNK_INDEX)['count']} chunks, {repeats} runs per query")
+
+    for keywords, match_type, operator in queries:
+        search.INDEX_NAME = NESTED_INDEX
+        nested = timed(search.search_rfps, keywords, match_type, operator)
+        search.INDEX_NAME, search.CHUNK_INDEX_NAME = NOTICE_INDEX, CHUNK_INDEX
+        chunks = timed(search.search_rfps_chunks, keywords, match_type, operator)
+        print(f"{keywords} {match_type}/{operator}: nested p50 {nested[0] * 1000:.0f}ms p95 {nested[1] * 1000:.0f}ms ({nested[2]} hits) | "
+              f"chunks p50 {chunks[0] * 1000:.0f}ms p95 {chunks[1] * 1000:.0f}ms ({chunks[2]} hits)")
+
+    es.indices.delete(index=f"{NESTED_INDEX},{NOTICE_INDEX},{CHUNK_INDEX}")
@@ -0,0 +1,36 @@
+# Startup time of each main.py step, measured in a fresh interpreter per step
+# Run from the repo root: python -m benchmarks.startup
+import sys
+import subprocess
+
+# What each step of main.py imports before doing any work
+step_imports = {
+    "1": ["elastic_search.extraction_sources.sam_gov"],
+    "2": ["elastic_search.start_elastic_search", "elastic_search.index_pdf_and_docs"],
+    "3": ["elasticsearch.helpers", "elastic_search.start_elastic_search", "summarizer.summarizer"],
+}
+# Before lazy loading every step imported everything and built the model at import time
+before = [module for modules in step_imports.values() for module in modules]
+before_setup = "import summarizer.summarizer as s; s.get_model(); s.get_aspect_vectors()"
+repeats = 3
+
+def time_imports(modules, setup=""):
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        + "".join(f"import {module}\n" for module in modules)
+        + f"{setup}\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    timings = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True, check=True)
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+if __name__ == "__main__":
+    print(f"Best of {repeats} fresh interpreters")
+    print(f"before (any step): {time_imports(before, before_setup):.2f}s")
+    for step, modules in step_imports.items():
+        print(f"step {step}: {time_imports(modules):.2f}s")
+    print(f"model + aspects, loaded on first use in step 3: {time_imports(['summarizer.summarizer'], before_setup) - time_imports(['summarizer.summarizer']):.2f}s")
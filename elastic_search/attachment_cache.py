@@ -0,0 +1,175 @@
+import os
+import json
+import atexit
+import hashlib
+import threading
+
+class AttachmentCache:
+    # Local cache of downloaded attachments and their Tika text, so unchanged attachments are
+    # neither downloaded nor parsed again:
+    #   content/<sha256>.bin, content/<sha256>.txt - raw bytes and extracted text, stored by content hash
+    #   index.json - url -> ETag / Last-Modified / Content-Length / sha256 of the last download,
+    #                sha256 -> size and last use (LRU eviction past max_bytes)
+    def __init__(self, folder, max_bytes=5 * 1024 ** 3):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.content_folder = os.path.join(folder, "content")
+        self.index_path = os.path.join(folder, "index.json")
+        self.lock = threading.Lock()
+        self.parsing = {} # sha256 -> lock, so the same content is only parsed once at a time
+
+        self.urls = {}
+        self.contents = {}
+        self.clock = 0
+        self.loaded = False
+        self.dirty = False
+
+        self.hits = 0 # still valid per ETag / Last-Modified: no download, no Tika
+        self.content_hits = 0 # downloaded again but same bytes: no Tika
+        self.misses = 0 # new content: Tika ran
+
+    def _load(self):
+        self.loaded = True
+        atexit.register(self.save)
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as r:
+            index = json.load(r)
+        self.urls = index["urls"]
+        self.contents = index["contents"]
+        self.clock = index["clock"]
+
+    def _path(self, sha, extension):
+        return os.path.join(self.content_folder, f"{sha}.{extension}")
+
+    def lookup(self, url):
+        # The cached entry for url, only if its text is still on disk
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            entry = self.urls.get(url)
+            if entry is None or entry["sha256"] not in self.contents:
+                return None
+            return dict(entry)
+
+    @staticmethod
+    def validators(entry):
+        # Conditional request headers: the server can answer 304 instead of sending the file again
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    @staticmethod
+    def still_valid(entry, response):
+        if response.status_code == 304:
+            return True
+        if response.status_code != 200:
+            return False
+        # Servers that ignore conditional requests: compare the validators they sent
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return False
+        return (
+            etag == entry.get("etag")
+            and last_modified == entry.get("last_modified")
+            and response.headers.get("Content-Length") == entry.get("content_length")
+        )
+
+    def cached_text(self, entry):
+        text = self._read_text(entry["sha256"])
+        if text is not None:
+            with self.lock:
+                self.hits += 1
+        return text
+
+    def _read_text(self, sha):
+        try:
+            with open(self._path(sha, "txt"), "r", encoding="utf-8") as r:
+                text = r.read()
+        except OSError:
+            return None
+        with self.lock:
+            if sha in self.contents:
+                self.clock += 1
+                self.contents[sha]["last_used"] = self.clock
+                self.dirty = True
+        return text
+
+    def store(self, url, headers, raw, extract):
+        # Returns the text for raw, calling extract() (Tika) only when this content was never parsed
+        sha = hashlib.sha256(raw).hexdigest()
+        with self.lock:
+            parsing = self.parsing.setdefault(sha, threading.Lock())
+
+        with parsing:
+            with self.lock:
+                known = sha in self.contents
+            text = self._read_text(sha) if known else None
+
+            if text is not None:
+                with self.lock:
+                    self.content_hits += 1
+            else:
+                text = extract()
+                os.makedirs(self.content_folder, exist_ok=True)
+                _write_atomic(self._path(sha, "bin"), raw)
+                _write_atomic(self._path(sha, "txt"), text.encode("utf-8"))
+                with self.lock:
+                    self.misses += 1
+                    self.clock += 1
+                    self.contents[sha] = {"size": len(raw) + len(text.encode("utf-8")), "last_used": self.clock}
+
+        with self.lock:
+            self.urls[url] = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "content_length": headers.get("Content-Length"),
+                "sha256": sha,
+            }
+            self.dirty = True
+            self._evict()
+        return text
+
+    def _evict(self):
+        # Called with the lock held
+        total = sum(c["size"] for c in self.contents.values())
+        if total <= self.max_bytes:
+            return
+        evicted = set()
+        for sha, content in sorted(self.contents.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= content["size"]
+            evicted.add(sha)
+            for extension in ("bin", "txt"):
+                try:
+                    os.remove(self._path(sha, extension))
+                except OSError:
+                    pass
+        for sha in evicted:
+            del self.contents[sha]
+        self.urls = {url: entry for url, entry in self.urls.items() if entry["sha256"] not in evicted}
+
+    def stats(self):
+        return f"Attachment cache: {self.hits} unchanged | {self.content_hits} same content | {self.misses} parsed"
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            self._evict()
+            os.makedirs(self.folder, exist_ok=True)
+            data = json.dumps({"clock": self.clock, "urls": self.urls, "contents": self.contents})
+            self.dirty = False
+        _write_atomic(self.index_path, data.encode("utf-8"))
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as w:
+        w.write(data)
+    os.replace(tmp_path, path)
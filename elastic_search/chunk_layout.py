@@ -0,0 +1,102 @@
+# Chunk layout: attachment text stored as one small document per passage in CHUNK_INDEX_NAME,
+# next to the notice document (without pdfs) in the main index. Searches highlight a few KB per hit
+# instead of analyzing nested pdf_text blobs of up to 1 MB, and are collapsed back to one hit per notice
+from elasticsearch import NotFoundError
+
+CHUNK_INDEX_NAME = "sam_opportunity_chunks_v1"
+CHUNK_CHARS = 1500 # about a passage; chunks end on whitespace when there is some near the limit
+NOTICE_FIELDS = ["naicsCode", "classificationCode", "postedDate"] # copied onto every chunk for filtering / pruning
+
+CHUNK_MAPPING = {
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+        "analysis": {
+            "analyzer": {
+                "eng_with_stop": {
+                    "type": "standard",
+                    "stopwords": "_english_"
+                }
+            }
+        }
+    },
+    "mappings": {
+        "properties": {
+            "noticeId": {"type": "keyword"},
+            "pdf_url": {"type": "keyword"},
+            "pdf_title": {"type": "text"},
+            "offset": {"type": "integer"}, # character offset of the chunk in the attachment text
+            "chunk": {"type": "integer"}, # position of the chunk within the notice
+            "chunk_text": {"type": "text", "analyzer": "eng_with_stop"},
+            "naicsCode": {"type": "keyword"},
+            "classificationCode": {"type": "keyword"},
+            "postedDate": {"type": "date"}
+        }
+    }
+}
+
+def ensure_chunk_index(es):
+    if not es.indices.exists(index=CHUNK_INDEX_NAME):
+        es.indices.create(index=CHUNK_INDEX_NAME, body=CHUNK_MAPPING)
+        print("Index created:", CHUNK_INDEX_NAME)
+
+def chunk_index_uuid(es):
+    try:
+        return es.indices.get_settings(index=CHUNK_INDEX_NAME)[CHUNK_INDEX_NAME]["settings"]["index"]["uuid"]
+    except NotFoundError:
+        return None
+
+def split_chunks(text, chunk_chars=CHUNK_CHARS):
+    # Yields (offset, chunk) covering text, cutting at the last whitespace of each window when
+    # it is in the second half, so words are not split
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            cut = max(text.rfind(" ", start + chunk_chars // 2, end), text.rfind("\n", start + chunk_chars // 2, end))
+            if cut != -1:
+                end = cut + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            yield start, chunk
+        start = end
+
+def chunk_actions(item, texts):
+    # One action per chunk of every attachment of item, ids <noticeId>:<chunk> so a re-indexed notice
+    # overwrites its old chunks; returns the actions and the number of chunks
+    notice_id = item.get("noticeId")
+    shared = {field: item.get(field) for field in NOTICE_FIELDS}
+    actions = []
+    for url, text in zip(item.get("resourceLinks") or [], texts):
+        title = url.split("/")[-1] or ""
+        for offset, chunk_text in split_chunks(text):
+            actions.append({
+                "_index": CHUNK_INDEX_NAME,
+                "_id": f"{notice_id}:{len(actions)}",
+                "_source": {
+                    "noticeId": notice_id,
+                    "pdf_url": url,
+                    "pdf_title": title,
+                    "offset": offset,
+                    "chunk": len(actions),
+                    "chunk_text": chunk_text,
+                    **shared
+                }
+            })
+    return actions, len(actions)
+
+def remove_stale_chunks(es, chunk_counts, batch=500):
+    # chunk_counts: noticeId -> number of chunks just indexed. Deletes the chunks left over from a longer
+    # earlier version of the notice; run after indexing, so the new chunks are never touched
+    notice_ids = list(chunk_counts)
+    for i in range(0, len(notice_ids), batch):
+        clauses = [
+            {"bool": {"filter": [{"term": {"noticeId": notice_id}}, {"range": {"chunk": {"gte": chunk_counts[notice_id]}}}]}}
+            for notice_id in notice_ids[i:i + batch]
+        ]
+        es.delete_by_query(index=CHUNK_INDEX_NAME, body={"query": {"bool": {"should": clauses}}}, conflicts="proceed")
+
+def remove_notice_chunks(es, notice_ids, batch=500):
+    notice_ids = list(notice_ids)
+    for i in range(0, len(notice_ids), batch):
+        es.delete_by_query(index=CHUNK_INDEX_NAME, body={"query": {"terms": {"noticeId": notice_ids[i:i + batch]}}}, conflicts="proceed")
@@ -1,5 +1,7 @@
 from elasticsearch import Elasticsearch
 from start_elastic_search import start_elastic_search, close_elastic_search
+from chunk_layout import CHUNK_INDEX_NAME, CHUNK_MAPPING
+from index_generation import bump_generation
 
 es, started_container = start_elastic_search()
 
@@ -62,4 +64,13 @@ if es.indices.exists(index=INDEX_NAME):
 es.indices.create(index=INDEX_NAME, body=mapping)
 print("Index created:", INDEX_NAME)
 
+# Passage documents of the chunks layout (INDEX_LAYOUT = "chunks" in index_pdf_and_docs.py)
+if es.indices.exists(index=CHUNK_INDEX_NAME):
+    print(f"Index {CHUNK_INDEX_NAME} exists, deleting...")
+    es.indices.delete(index=CHUNK_INDEX_NAME)
+
+es.indices.create(index=CHUNK_INDEX_NAME, body=CHUNK_MAPPING)
+print("Index created:", CHUNK_INDEX_NAME)
+bump_generation() # drops cached search results of the old indices
+
 close_elastic_search(es, started_container)
\ No newline at end of file
@@ -1,13 +1,20 @@
+import os
 import subprocess
 import socket
 import time
 from elasticsearch import Elasticsearch
 from elastic_search.start_elastic_search import start_elastic_search, close_elastic_search
+from elastic_search.index_generation import bump_generation
+from elastic_search.chunk_layout import CHUNK_INDEX_NAME
+
+INDEX_STATE_PATH = "index_state.json" # INDEX_STATE_PATH of index_pdf_and_docs.py
 
 es, started_container = start_elastic_search()
 
+# Both layouts: notices (with their pdfs) and the passage chunks of the chunks layout, when that index exists
 resp = es.delete_by_query(
-    index="sam_opportunities_v1",
+    index=f"sam_opportunities_v1,{CHUNK_INDEX_NAME}",
+    ignore_unavailable=True,
     body={
         "query": {
             "match_all": {}
@@ -16,5 +23,10 @@ resp = es.delete_by_query(
 )
 
 print(f"Deleted {resp['deleted']} documents.")
+bump_generation() # cached searches must not return the deleted notices
+
+# The incremental state describes what was in the index: without it the next run indexes everything again
+if os.path.exists(INDEX_STATE_PATH):
+    os.remove(INDEX_STATE_PATH)
 
 close_elastic_search(es, started_container)
\ No newline at end of file
@@ -0,0 +1,142 @@
+# Browser path for notices the API could not describe: several tabs scraping notice pages at once,
+# each waiting for #desc to render instead of sleeping a fixed time. Pages showing a captcha are put
+# aside in a pause queue and handled interactively once the other pages are done
+import queue
+import threading
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
+from elastic_search.extraction_sources.captcha_handling import is_captcha_in_html, check_for_captcha
+
+BROWSER_TABS = 4 # notice pages loading at once
+PAGE_TIMEOUT = 20 # seconds to wait for a page to render #desc
+POLL_INTERVAL = 0.25
+
+def page_state(driver):
+    # WebDriverWait condition: "ready" once the description rendered (or the page is complete without one),
+    # "captcha" when a captcha is shown instead, False while still loading
+    found = driver.find_elements(By.ID, "desc")
+    if found and found[0].text.strip():
+        return "ready"
+    if is_captcha_in_html(driver.page_source or ""):
+        return "captcha"
+    if driver.find_elements(By.ID, "links-attachments") and driver.execute_script("return document.readyState") == "complete":
+        return "ready"
+    return False
+
+def wait_for_page(driver, timeout=PAGE_TIMEOUT):
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=POLL_INTERVAL).until(page_state)
+    except TimeoutException:
+        return "timeout"
+
+def read_notice_page(driver, item):
+    # Same fields as the API path: description text, resourceLinks extended with the page's attachment links
+    ui_link = item.get("uiLink")
+    description_text = ""
+    try:
+        desc_el = driver.find_element(By.ID, "desc")
+        description_text = desc_el.text.strip()
+    except NoSuchElementException:
+        print(f"[WARN] Description not found for {ui_link}")
+    if description_text:
+        description_text = " ".join(description_text.replace("\r", "\n").split())
+
+    item["description"] = description_text
+
+    existing_links = item.get("resourceLinks") or []
+    if not isinstance(existing_links, list):
+        existing_links = []
+
+    try:
+        links_container = driver.find_element(By.ID, "links-attachments")
+        link_elements = links_container.find_elements(By.TAG_NAME, "a")
+
+        for link in link_elements:
+            href = link.get_attribute("href")
+            if href and href not in existing_links:
+                existing_links.append(href)
+
+    except NoSuchElementException:
+        pass
+
+    item["resourceLinks"] = existing_links
+
+class BrowserPool:
+    # new_tab() returns a webdriver whose current window is a tab of its own; one thread drives each tab
+    def __init__(self, new_tab, tabs=BROWSER_TABS, page_timeout=PAGE_TIMEOUT):
+        self.new_tab = new_tab
+        self.tabs = tabs
+        self.page_timeout = page_timeout
+        self.paused = queue.Queue() # items whose page showed a captcha
+        self.drivers = []
+        self.on_done = None
+
+    def _worker(self, driver, work):
+        while True:
+            try:
+                item = work.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                driver.get(item["uiLink"])
+                state = wait_for_page(driver, self.page_timeout)
+                if state == "captcha":
+                    # Not solved here: the other tabs keep going, the page is retried at the end
+                    print(f"[CAPTCHA] {item['uiLink']} queued for later")
+                    self.paused.put(item)
+                    continue
+                read_notice_page(driver, item)
+                self._done(item)
+            except WebDriverException as e:
+                print(f"[WARN] Could not load {item.get('uiLink')}: {e.msg}")
+
+    def _done(self, item):
+        if self.on_done is not None:
+            self.on_done(item)
+
+    def _resolve_paused(self, driver):
+        # One page at a time with the user: solving the captcha once usually clears it for the rest
+        while not self.paused.empty():
+            item = self.paused.get()
+            try:
+                driver.get(item["uiLink"])
+                if wait_for_page(driver, self.page_timeout) == "captcha":
+                    check_for_captcha(driver, poll_interval=20)
+                    wait_for_page(driver, self.page_timeout)
+                read_notice_page(driver, item)
+                self._done(item)
+            except RuntimeError:
+                print("[INFO] Skipping URL due to captcha.")
+            except WebDriverException as e:
+                print(f"[WARN] Could not load {item.get('uiLink')}: {e.msg}")
+
+    def scrape(self, opps, on_done=None):
+        # Fills description / resourceLinks of opps in place, calling on_done(item) (from a tab's thread)
+        # for every page read
+        self.on_done = on_done
+        work = queue.Queue()
+        for item in opps:
+            if item.get("uiLink"):
+                work.put(item)
+
+        while len(self.drivers) < min(self.tabs, max(work.qsize(), 1)):
+            self.drivers.append(self.new_tab())
+
+        threads = [threading.Thread(target=self._worker, args=(driver, work)) for driver in self.drivers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if not self.paused.empty():
+            print(f"[ACTION REQUIRED] {self.paused.qsize()} pages showed a captcha")
+            self._resolve_paused(self.drivers[0])
+
+    def close(self):
+        for driver in self.drivers:
+            try:
+                driver.close()
+            except WebDriverException:
+                pass
+        self.drivers = []
@@ -0,0 +1,79 @@
+import os
+import json
+import threading
+
+class NdjsonWriter:
+    # Step 1 output, one opportunity per line, appended as soon as the opportunity is complete:
+    # step 2 can read it while step 1 is still scraping, and a crash keeps everything already written.
+    #   <path>.checkpoint - the search the file belongs to and whether step 1 finished it.
+    # Running the same search again after a crash resumes after the last complete line
+    def __init__(self, path, query):
+        self.path = path
+        self.query = query
+        self.lock = threading.Lock()
+        self.written = set() # noticeIds in the file
+
+        checkpoint = read_checkpoint(path)
+        if checkpoint is not None and checkpoint["query"] == query and not checkpoint["complete"] and os.path.exists(path):
+            self._resume()
+            print(f"Resuming {path}: {len(self.written)} opportunities already written")
+        else:
+            open(path, "w").close()
+        self._write_checkpoint(complete=False)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _resume(self):
+        # Keeps the complete lines, drops a line cut short by the crash
+        valid_bytes = 0
+        with open(self.path, "rb") as r:
+            for line in r:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    break
+                self.written.add(item.get("noticeId"))
+                valid_bytes += len(line)
+        with open(self.path, "r+b") as w:
+            w.truncate(valid_bytes)
+
+    def _write_checkpoint(self, complete):
+        tmp_path = checkpoint_path(self.path) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as w:
+            json.dump({"query": self.query, "complete": complete}, w)
+        os.replace(tmp_path, checkpoint_path(self.path))
+
+    def write(self, item):
+        # Thread safe; every noticeId is written once
+        line = json.dumps(item, ensure_ascii=False) + "\n"
+        with self.lock:
+            notice_id = item.get("noticeId")
+            if notice_id in self.written:
+                return
+            self.file.write(line)
+            self.file.flush()
+            self.written.add(notice_id)
+
+    def close(self, remaining=()):
+        # Writes whatever of remaining is not in the file yet, then marks the file complete
+        for item in remaining:
+            self.write(item)
+        with self.lock:
+            self.file.close()
+        self._write_checkpoint(complete=True)
+
+def checkpoint_path(path):
+    return path + ".checkpoint"
+
+def read_checkpoint(path):
+    try:
+        with open(checkpoint_path(path), "r", encoding="utf-8") as r:
+            return json.load(r)
+    except (OSError, ValueError):
+        return None
+
+def is_complete(path):
+    # A file without checkpoint was not written by step 1 (or by an older version), nothing more will come
+    checkpoint = read_checkpoint(path)
+    return checkpoint is None or checkpoint["complete"]
@@ -1,19 +1,52 @@
-# I need to apply retry logic as the api hangs often
-import requests
 from datetime import datetime, timedelta
 import json
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
 import time
-from elastic_search.extraction_sources.captcha_handling import check_for_captcha
+from elastic_search.extraction_sources.browser_pool import BrowserPool, BROWSER_TABS
+from elastic_search.extraction_sources.sam_gov_api import fetch_opportunities, fill_descriptions
+from elastic_search.extraction_sources.ndjson_output import NdjsonWriter
 import subprocess
 
 
 REMOTE_DEBUGGING_PORT = 9222
+BROWSER_FREE = True # descriptions from the API's description links, Chrome only for notices where that fails
+OUTPUT_FORMAT = "ndjson" # "ndjson": sam_gov_output.ndjson written as notices complete, "json": sam_gov_output.json at the end
+NDJSON_OUTPUT = "sam_gov_output.ndjson"
+
+def open_tab(driver_path):
+    # Every tab gets its own driver session attached to the same Chrome, so tabs can be driven from
+    # separate threads and share the profile (a captcha solved once counts for all of them)
+    chrome_options = Options()
+    chrome_options.add_experimental_option("debuggerAddress", f"127.0.0.1:{REMOTE_DEBUGGING_PORT}")
+    driver = webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+    driver.switch_to.new_window("tab")
+    return driver
+
+def scrape_with_browser(opps, on_done=None):
+    # Reads #desc and #links-attachments from each notice page in Chrome, BROWSER_TABS pages at a time
+    subprocess.Popen([
+        "google-chrome-stable",
+        "--remote-debugging-port=9222",
+        "--user-data-dir=/tmp/ChromeScrape",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--disable-extensions",
+        "--disable-gpu",
+        "--disable-software-rasterizer"
+    ])
+    time.sleep(5)  # gives Chrome time to initialize
+
+    print("\nConnecting to existing Chrome session...")
+    driver_path = ChromeDriverManager().install()
+    pool = BrowserPool(lambda: open_tab(driver_path), tabs=BROWSER_TABS)
+    try:
+        pool.scrape(opps, on_done)
+    finally:
+        pool.close()
+
 
 with open ("secret.json", "r") as r:
     config = json.load(r)
@@ -22,100 +55,32 @@ with open ("secret.json", "r") as r:
     def fetch_rfps_from_sam_gov(naic_code, how_back):
         end_date = datetime.today().date()
         start_date = end_date - timedelta(days=int(how_back))
-        posted_from = start_date.strftime("%m/%d/%Y")
-        posted_to = end_date.strftime("%m/%d/%Y")
-
-        url = "https://api.sam.gov/opportunities/v2/search"
-
-        params = {
-            "api_key": api_key,
-            "postedFrom": posted_from,
-            "postedTo": posted_to,
-            "ptype": "o",          # solicitation-type
-            "limit": 1000,
-            "offset": 0
-        }
-
-        if naic_code:
-            params["ncode"] = naic_code
-
-        #r = requests.get(url, params=params)
-        r = requests.get(url, params=params)
 
-        r.raise_for_status()
-
-        data = r.json()
+        data = fetch_opportunities(api_key, start_date, end_date, naic_code)
         print(f"Fetched {len(data.get('opportunitiesData', []))} opportunities from SAM.gov")
 
-        subprocess.Popen([
-            "google-chrome-stable",
-            "--remote-debugging-port=9222",
-            "--user-data-dir=/tmp/ChromeScrape",
-            "--no-first-run",
-            "--no-default-browser-check",
-            "--disable-extensions",
-            "--disable-gpu",
-            "--disable-software-rasterizer"
-        ])
-        time.sleep(5)  # gives Chrome time to initialize
-
-        print("\nConnecting to existing Chrome session...")
-        chrome_options = Options()
-        chrome_options.add_experimental_option("debuggerAddress", f"127.0.0.1:{REMOTE_DEBUGGING_PORT}")
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-        print("Connected successfully!")       
-
-        # Open a single new tab at the start
-        driver.execute_script("window.open('about:blank', '_blank');")
-        driver.switch_to.window(driver.window_handles[-1])
-
         opps = data.get("opportunitiesData", [])
-
-        for item in opps:
-            ui_link = item.get("uiLink")
-            if not ui_link:
-                continue
-
-            driver.get(ui_link)
-            time.sleep(7)
-
-            try:
-                check_for_captcha(driver, poll_interval=20)
-            except RuntimeError:
-                print("[INFO] Skipping URL due to captcha.")
-                continue
-
-            description_text = ""
-            try:
-                desc_el = driver.find_element(By.ID, "desc")
-                description_text = desc_el.text.strip()
-            except NoSuchElementException:
-                print(f"[WARN] Description not found for {ui_link}")
-            if description_text:
-                description_text = " ".join(description_text.replace("\r", "\n").split())
-
-            item["description"] = description_text
-
-            existing_links = item.get("resourceLinks") or []
-            if not isinstance(existing_links, list):
-                existing_links = []
-
-            try:
-                links_container = driver.find_element(By.ID, "links-attachments")
-                link_elements = links_container.find_elements(By.TAG_NAME, "a")
-
-                for link in link_elements:
-                    href = link.get_attribute("href")
-                    if href and href not in existing_links:
-                        existing_links.append(href)
-
-            except NoSuchElementException:
-                pass
-
-            item["resourceLinks"] = existing_links
-
-        with open ("sam_gov_output.json", "w") as f:
-            json.dump(data, f, indent = 4)
+        writer = None
+        if OUTPUT_FORMAT == "ndjson":
+            query = {"naic_code": naic_code, "posted_from": str(start_date), "posted_to": str(end_date)}
+            writer = NdjsonWriter(NDJSON_OUTPUT, query)
+            opps = [item for item in opps if item.get("noticeId") not in writer.written]
+        on_done = writer.write if writer is not None else None
+
+        browser_opps = opps
+        if BROWSER_FREE:
+            browser_opps = fill_descriptions(browser_opps, api_key, on_filled=on_done)
+            print(f"Descriptions fetched from the API, {len(browser_opps)} opportunities left for the browser")
+        if browser_opps:
+            scrape_with_browser(browser_opps, on_done)
+
+        if writer is not None:
+            # Notices without page or skipped at a captcha are kept as they came from the API, like in the JSON
+            writer.close(opps)
+            print(f"Wrote {len(writer.written)} opportunities to {NDJSON_OUTPUT}")
+        else:
+            with open ("sam_gov_output.json", "w") as f:
+                json.dump(data, f, indent = 4)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+# Fetch engine for the SAM.gov opportunities search API: every page of every date window,
+# fetched concurrently over one pooled session, with retries for the hangs / 429s / 5xx the API is known for.
+# Also fetches the description texts the search results only link to, so no browser is needed for them
+import time
+import random
+import requests
+from datetime import timedelta
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+SEARCH_URL = "https://api.sam.gov/opportunities/v2/search"
+PAGE_LIMIT = 1000 # most the API returns per request
+WINDOW_DAYS = 30 # date ranges longer than this are split into sub-windows fetched in parallel
+API_WORKERS = 4 # search requests in flight at once
+DESCRIPTION_WORKERS = 8 # description requests in flight at once
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0 # seconds, doubled every retry
+BACKOFF_CAP = 30.0
+TIMEOUT = (10, 60) # connect / read, a hung request is retried instead of waiting forever
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+POOL_SIZE = max(API_WORKERS, DESCRIPTION_WORKERS) # connections kept open to the API
+
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+session.mount("http://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+
+def backoff(attempt, retry_after=None):
+    # Exponential backoff with full jitter, unless the server said how long to wait
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), BACKOFF_CAP)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def get_with_retry(url, params, timeout=TIMEOUT, max_retries=MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        try:
+            r = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff(attempt)
+            print(f"[RETRY] {e.__class__.__name__}, retrying in {delay:.1f}s")
+        else:
+            if r.status_code not in RETRY_STATUSES or attempt == max_retries:
+                r.raise_for_status()
+                return r
+            delay = backoff(attempt, r.headers.get("Retry-After"))
+            print(f"[RETRY] HTTP {r.status_code}, retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+def date_windows(start_date, end_date, window_days=WINDOW_DAYS):
+    # Consecutive, non-overlapping (from, to) date pairs covering start_date..end_date inclusive
+    windows = []
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(window_start + timedelta(days=window_days - 1), end_date)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(days=1)
+    return windows
+
+def fetch_opportunities(api_key, start_date, end_date, naic_code=None, url=SEARCH_URL, workers=API_WORKERS, window_days=WINDOW_DAYS):
+    # Returns the search response shape ({"totalRecords", "opportunitiesData"}) for the whole range,
+    # in window then offset order, each noticeId once
+    def params_for(window, offset):
+        params = {
+            "api_key": api_key,
+            "postedFrom": window[0].strftime("%m/%d/%Y"),
+            "postedTo": window[1].strftime("%m/%d/%Y"),
+            "ptype": "o",          # solicitation-type
+            "limit": PAGE_LIMIT,
+            "offset": offset
+        }
+        if naic_code:
+            params["ncode"] = naic_code
+        return params
+
+    def fetch_page(window, offset):
+        return get_with_retry(url, params_for(window, offset)).json()
+
+    windows = date_windows(start_date, end_date, window_days)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # First page of every window tells how many more pages it has
+        first_pages = [pool.submit(fetch_page, window, 0) for window in windows]
+        pages = []
+        for window, future in zip(windows, first_pages):
+            first = future.result()
+            total = first.get("totalRecords", 0)
+            rest = [pool.submit(fetch_page, window, offset) for offset in range(PAGE_LIMIT, total, PAGE_LIMIT)]
+            pages.append((window, total, first, rest))
+
+        opps = []
+        seen = set()
+        for window, total, first, rest in pages:
+            window_opps = list(first.get("opportunitiesData", []))
+            for future in rest:
+                window_opps.extend(future.result().get("opportunitiesData", []))
+            if len(window_opps) < total:
+                print(f"[WARN] {window[0]} - {window[1]}: got {len(window_opps)} of {total} opportunities")
+            for item in window_opps:
+                notice_id = item.get("noticeId")
+                if notice_id in seen:
+                    continue
+                seen.add(notice_id)
+                opps.append(item)
+
+    return {"totalRecords": len(opps), "opportunitiesData": opps}
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+def html_to_text(html):
+    # Same whitespace handling as the browser path applies to the #desc text
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return " ".join(" ".join(extractor.parts).split())
+
+def fetch_description(api_key, url):
+    # The search results only carry a link to the description (noticedesc endpoint), not its text.
+    # Returns None when there is no usable description behind the link
+    r = get_with_retry(url, {"api_key": api_key})
+    try:
+        body = r.json()
+        description = body.get("description") if isinstance(body, dict) else None
+    except ValueError:
+        description = r.text
+    if not description:
+        return None
+    return html_to_text(description) or None
+
+def fill_descriptions(opps, api_key, workers=DESCRIPTION_WORKERS, on_filled=None):
+    # Replaces each item's description link with the description text, concurrently.
+    # resourceLinks already come with the search results. on_filled(item) is called (from a worker thread)
+    # for each item as soon as it is done. Returns the items that still need the browser
+    def fill(item):
+        url = item.get("description")
+        if not url or not url.startswith("http"):
+            return False
+        try:
+            text = fetch_description(api_key, url)
+        except requests.RequestException as e:
+            print(f"[WARN] Description fetch failed for {item.get('noticeId')}: {e}")
+            return False
+        if text is None:
+            return False
+        item["description"] = text
+        item["resourceLinks"] = item.get("resourceLinks") or []
+        if on_filled is not None:
+            on_filled(item)
+        return True
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        filled = list(pool.map(fill, opps))
+    return [item for item, ok in zip(opps, filled) if not ok]
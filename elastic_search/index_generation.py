@@ -0,0 +1,22 @@
+# Index generation: a counter bumped whenever index_rfps, create_index.py or delete_all_index.py change the indices.
+# The search interface (main.py) keys its result cache on it, so cached results stop being used
+# as soon as the index changes, without asking ES
+import os
+import json
+
+GENERATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_generation.json")
+
+def read_generation(path=GENERATION_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as r:
+            return json.load(r)["generation"]
+    except (OSError, ValueError, KeyError):
+        return 0
+
+def bump_generation(path=GENERATION_PATH):
+    generation = read_generation(path) + 1
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as w:
+        json.dump({"generation": generation}, w)
+    os.replace(tmp_path, path)
+    return generation
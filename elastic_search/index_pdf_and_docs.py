@@ -1,7 +1,21 @@
+import os
 import json 
+import time
 import requests
+import threading
 from io import BytesIO
-from elasticsearch import Elasticsearch, helpers
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from elasticsearch import Elasticsearch, NotFoundError, helpers
+from elastic_search.attachment_cache import AttachmentCache
+from elastic_search.index_state import IndexState, too_old
+from elastic_search.index_generation import bump_generation
+from elastic_search.chunk_layout import (
+    CHUNK_INDEX_NAME, ensure_chunk_index, chunk_index_uuid, chunk_actions, remove_stale_chunks, remove_notice_chunks,
+)
+from elastic_search.extraction_sources.ndjson_output import is_complete, checkpoint_path
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module='tika')
 from tika import parser as tika_parser
@@ -9,122 +23,396 @@ from tika import parser as tika_parser
 ES_HOST = "http://localhost:9201"
 INDEX_NAME = "sam_opportunities_v1"
 INPUT = "sam_gov_output.json"
+INPUT_NDJSON = "sam_gov_output.ndjson" # read instead of INPUT when step 1 wrote it last
+FOLLOW_INPUT = True # keep indexing new lines while step 1 is still writing INPUT_NDJSON
+FOLLOW_IDLE_TIMEOUT = 30 * 60 # give up waiting when step 1 wrote nothing for this long (it probably crashed)
+FOLLOW_STALE_AFTER = 5 * 60 # an unfinished INPUT_NDJSON not written for this long is not followed at all
 MAX_BYTES = 20 * 1024 * 1024 # 50 MB cutoff
+FETCH_WORKERS = 8 # attachments downloaded / parsed at the same time
+PER_HOST_LIMIT = 4 # concurrent downloads from any single host
+MAX_PENDING_NOTICES = 16 # notices whose attachments are in flight ahead of the bulk indexer
+USE_ATTACHMENT_CACHE = True # skip downloading / parsing attachments that did not change since the last run
+ATTACHMENT_CACHE_FOLDER = "attachment_cache"
+ATTACHMENT_CACHE_MAX_BYTES = 5 * 1024 ** 3
+BULK_MAX_DOCS = 500 # a bulk request is sent at whichever of these two limits comes first
+BULK_MAX_BYTES = 10 * 1024 * 1024
+BULK_THREADS = 2 # bulk requests in flight at once
+BULK_MAX_RETRIES = 5 # retries of documents rejected with 429 (ES busy), with exponential backoff
+INCREMENTAL_INDEXING = True # only index notices that changed since the last run, prune expired ones by ID
+INDEX_STATE_PATH = "index_state.json"
+INDEX_LAYOUT = "nested" # "nested": attachments as 1 MB pdfs blobs in the notice, "chunks": passage documents in CHUNK_INDEX_NAME
 es = Elasticsearch(ES_HOST)
+attachment_cache = AttachmentCache(ATTACHMENT_CACHE_FOLDER, ATTACHMENT_CACHE_MAX_BYTES) if USE_ATTACHMENT_CACHE else None
+
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS))
+session.mount("https://", HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS))
+
+host_slots = {}
+host_slots_lock = threading.Lock()
+
+def host_slot(url):
+    host = urlparse(url).netloc
+    with host_slots_lock:
+        if host not in host_slots:
+            host_slots[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+        return host_slots[host]
+
+def read_limited(r):
+    # Returns the raw bytes, or None when the file is over MAX_BYTES
+    data = BytesIO()
+    written = 0
+    for chunk in r.iter_content(chunk_size=8192):
+        if not chunk:
+            break
+        written += len(chunk)
+        if written > MAX_BYTES:
+            data.close()
+            r.close()
+            return None
+        data.write(chunk)
+
+    raw = data.getvalue()
+    data.close()
+    return raw
+
+def extract(raw, url):
+    # Let Tika detect type automatically
+    parsed = tika_parser.from_buffer(raw)
+    if not parsed:
+        print("Tika couldnt find it")
+    else:
+        print("TIka found stuff")
+    content = parsed.get("content")
+
+    if content:
+        content = content.strip()
+    else:
+        content = "Unable to read content"
+        print("Unable to read content. This attachment must be a scan or a picture")
+        print(f"Attachment Link: {url}")
+
+    return content
 
 def fetch_and_extract(url, ui_link):
     try:
-        r = requests.get(url, stream=True, timeout=30)
-        r.raise_for_status()
-
-        # Read content with max size limit
-        data = BytesIO()
-        written = 0
-        for chunk in r.iter_content(chunk_size=8192):
-            if not chunk:
-                break
-            written += len(chunk)
-            if written > MAX_BYTES:
-                data.close()
-                return "File skipped because too large"
-            data.write(chunk)
-
-        raw = data.getvalue()
-        data.close()
-
-        # Let Tika detect type automatically
-        parsed = tika_parser.from_buffer(raw)
-        if not parsed:
-            print("Tika couldnt find it")
-        else:
-            print("TIka found stuff")
-        content = parsed.get("content")
-
-        if content:
-            content = content.strip()
-        else:
-            content = "Unable to read content"
-            print("Unable to read content. This attachment must be a scan or a picture")
-            print(f"Attachment Link: {url}")
-
-        return content
+        entry = attachment_cache.lookup(url) if attachment_cache is not None else None
+
+        # The host slot is only held while downloading, so parsing overlaps with other downloads
+        with host_slot(url):
+            r = session.get(url, stream=True, timeout=30, headers=AttachmentCache.validators(entry))
+            if entry is not None and AttachmentCache.still_valid(entry, r):
+                text = attachment_cache.cached_text(entry)
+                if text is not None:
+                    r.close()
+                    return text
+                if r.status_code == 304:
+                    # Text went missing from the cache, download it again
+                    r.close()
+                    r = session.get(url, stream=True, timeout=30)
+            r.raise_for_status()
+            raw = read_limited(r)
+
+        if raw is None:
+            return "File skipped because too large"
+        if attachment_cache is None:
+            return extract(raw, url)
+        return attachment_cache.store(url, r.headers, raw, lambda: extract(raw, url))
 
     except Exception as e:
         print(f"Error: {e}")
         return ""
 
-def index_rfps(es): 
+def build_pdfs(url, text):
+    pdfs = []
+    # Only chunk if text is long; otherwise keep as one chunk
+    chunk_size = 1_000_000
+    if len(text) <= chunk_size:
+        pdfs.append({
+            "pdf_url": url,
+            "pdf_title": url.split("/")[-1] or "",
+            "pdf_text": text
+        })
+    else:
+        num_chunks = (len(text) // chunk_size) + 1
+        for i in range(num_chunks):
+            start = i * chunk_size
+            end = start + chunk_size
+            chunk_text = text[start:end]
+            pdfs.append({
+                "pdf_url": url,
+                "pdf_title": f"{url.split('/')[-1]} ({i+1})",
+                "pdf_text": chunk_text
+            })
+    return pdfs
+
+def fetch_documents(opps, workers=FETCH_WORKERS):
+    # Yields (item, texts) in input order, texts being one extracted text per resource link.
+    # Attachments of up to MAX_PENDING_NOTICES notices are downloaded and parsed concurrently
+    # while the caller indexes the ones already done
+    def finish(item, futures):
+        return item, [future.result() for future in futures]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in opps:
+            resource_links = item.get("resourceLinks") or []
+            futures = [pool.submit(fetch_and_extract, url, item.get("uiLink")) for url in resource_links]
+            pending.append((item, futures))
+            while len(pending) > MAX_PENDING_NOTICES:
+                yield finish(*pending.popleft())
+        while pending:
+            yield finish(*pending.popleft())
+
+def source_size(value):
+    # Characters of the strings in a document, about its JSON size for text-heavy documents
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + source_size(item) for key, item in value.items())
+    if isinstance(value, list):
+        return sum(source_size(item) for item in value)
+    return 0
+
+def bulk_index(es, actions, threads=BULK_THREADS):
+    # Sends actions in bulk requests of up to BULK_MAX_DOCS documents / BULK_MAX_BYTES bytes.
+    # Each thread runs its own streaming_bulk over the shared action stream, so 429s are retried
+    # with backoff (parallel_bulk does not retry)
+    stats = {"docs": 0, "bytes": 0, "errors": 0, "failed_ids": set()}
+    lock = threading.Lock()
+    actions = iter(actions)
+
+    def shared_actions():
+        # Only next() is under the lock; the size is estimated from the text lengths of the document,
+        # serializing it here would be a second json.dumps of up to 1 MB on top of streaming_bulk's own
+        docs = 0
+        size = 0
+        try:
+            while True:
+                with lock:
+                    try:
+                        action = next(actions)
+                    except StopIteration:
+                        return
+                docs += 1
+                size += source_size(action.get("_source"))
+                yield action
+        finally:
+            with lock:
+                stats["docs"] += docs
+                stats["bytes"] += size
+
+    def send():
+        for ok, item in helpers.streaming_bulk(
+            es, shared_actions(), chunk_size=BULK_MAX_DOCS, max_chunk_bytes=BULK_MAX_BYTES,
+            max_retries=BULK_MAX_RETRIES, raise_on_error=False, yield_ok=False,
+        ):
+            op_type, result = next(iter(item.items()))
+            if op_type == "delete" and result.get("status") == 404:
+                continue # already gone
+            with lock:
+                stats["errors"] += 1
+                stats["failed_ids"].add(result.get("_id"))
+            print(f"Bulk error: {item}")
+
+    start = time.perf_counter()
+    if threads <= 1:
+        send()
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [pool.submit(send) for _ in range(threads)]:
+                future.result()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    mb = stats["bytes"] / 1024 / 1024
+    print(f"Indexed {stats['docs']} docs ({mb:.1f} MB) in {elapsed:.1f}s: "
+          f"{stats['docs'] / elapsed:.1f} docs/s, {mb / elapsed:.2f} MB/s, {stats['errors']} errors")
+    return stats
+
+def build_action(item, texts, with_pdfs=True):
+    doc = {}
+    # Copy all top-level fields dynamically
+    for k, v in item.items():
+        doc[k] = v
+
+    notice_id = doc.get("noticeId")
+    resource_links = doc.get("resourceLinks")
+
+    if resource_links and with_pdfs:
+        pdfs = []
+        for url, text in zip(resource_links, texts):
+            pdfs.extend(build_pdfs(url, text))
+
+        doc["pdfs"] = pdfs
+
+    return {
+        "_index": INDEX_NAME,
+        "_id": notice_id,
+        "_source": doc
+    }
+
+def index_uuid(es, layout=INDEX_LAYOUT):
+    try:
+        uuid = es.indices.get_settings(index=INDEX_NAME)[INDEX_NAME]["settings"]["index"]["uuid"]
+    except NotFoundError:
+        return None
+    if layout == "chunks":
+        # The state covers both indices: recreating either one means indexing everything again
+        chunk_uuid = chunk_index_uuid(es)
+        return f"{uuid}/{chunk_uuid}" if chunk_uuid is not None else None
+    return uuid
+
+def notice_count(es):
+    # Notice documents in INDEX_NAME, one per notice in both layouts
+    try:
+        es.indices.refresh(index=INDEX_NAME)
+        return es.count(index=INDEX_NAME)["count"]
+    except NotFoundError:
+        return None
+
+def indexed_notices(es):
+    # (noticeId, postedDate) of every notice document in INDEX_NAME
+    es.indices.refresh(index=INDEX_NAME)
+    for hit in helpers.scan(es, index=INDEX_NAME, query={"query": {"match_all": {}}, "_source": ["postedDate"]}):
+        yield hit["_id"], hit["_source"].get("postedDate")
+
+def last_written(path):
+    paths = [p for p in (path, checkpoint_path(path)) if os.path.exists(p)]
+    return max(os.path.getmtime(p) for p in paths) if paths else 0
+
+def read_opportunities(path, follow=FOLLOW_INPUT, poll_interval=1.0, idle_timeout=FOLLOW_IDLE_TIMEOUT, stale_after=FOLLOW_STALE_AFTER):
+    # Yields the opportunities of an NDJSON file one line at a time. With follow, waits for the lines
+    # step 1 has not written yet until it marks the file complete
+    if follow and not is_complete(path) and time.time() - last_written(path) > stale_after:
+        print(f"{path} is incomplete and step 1 has not written to it for {stale_after}s (it probably crashed), "
+              f"indexing the opportunities it has")
+        follow = False
+    partial = ""
+    idle_since = time.monotonic()
+    with open(path, "r", encoding="utf-8") as r:
+        while True:
+            line = r.readline()
+            if line.endswith("\n"):
+                line, partial = partial + line, ""
+                if line.strip():
+                    yield json.loads(line)
+                idle_since = time.monotonic()
+                continue
+            partial += line # end of what is written so far, maybe in the middle of a line
+
+            if not follow:
+                return
+            if is_complete(path):
+                # Step 1 may have appended more between the readline above and the checkpoint
+                for line in (partial + r.read()).splitlines():
+                    if line.strip():
+                        yield json.loads(line)
+                return
+            if time.monotonic() - idle_since > idle_timeout:
+                print(f"Nothing new in {path} for {idle_timeout}s and step 1 did not finish it, stopping")
+                return
+            time.sleep(poll_interval)
+
+def load_opportunities():
+    # Whichever of the two step 1 wrote last: OUTPUT_FORMAT may have changed since the other one was written
+    if os.path.exists(INPUT_NDJSON) and (not os.path.exists(INPUT) or os.path.getmtime(INPUT_NDJSON) >= os.path.getmtime(INPUT)):
+        print(f"Reading {INPUT_NDJSON}")
+        return read_opportunities(INPUT_NDJSON)
     with open(INPUT, "r") as f:
         data = json.load(f)
+    return data.get("opportunitiesData", [])
 
-    opps = data.get("opportunitiesData", [])
-    actions = []
+def index_rfps(es, incremental=INCREMENTAL_INDEXING, layout=INDEX_LAYOUT):
+    opps = load_opportunities()
     noresourcelinks = 0
+    unchanged = 0
+    indexed = [] # (notice, all attachments came through), recorded in the state once indexed
+    chunk_counts = {} # chunks layout: noticeId -> chunks indexed
 
-    for item in opps:
-        doc = {}
-        # Copy all top-level fields dynamically
-        for k, v in item.items():
-            doc[k] = v
-
-        notice_id = doc.get("noticeId")
-        resource_links = doc.get("resourceLinks")
-
-        if not resource_links:
-            noresourcelinks += 1
-        else:
-            pdfs = []
-            for url in resource_links:
-                text = fetch_and_extract(url, doc["uiLink"])
-                # Only chunk if text is long; otherwise keep as one chunk
-                chunk_size = 1_000_000
-                if len(text) <= chunk_size:
-                    pdfs.append({
-                        "pdf_url": url,
-                        "pdf_title": url.split("/")[-1] or "",
-                        "pdf_text": text
-                    })
-                else:
-                    num_chunks = (len(text) // chunk_size) + 1
-                    for i in range(num_chunks):
-                        start = i * chunk_size
-                        end = start + chunk_size
-                        chunk_text = text[start:end]
-                        pdfs.append({
-                            "pdf_url": url,
-                            "pdf_title": f"{url.split('/')[-1]} ({i+1})",
-                            "pdf_text": chunk_text
-                        })
-
-            doc["pdfs"] = pdfs
-
-        actions.append({
-            "_index": INDEX_NAME,
-            "_id": notice_id,
-            "_source": doc
-        })
+    if layout == "chunks":
+        ensure_chunk_index(es)
 
-        if len(actions) >= 3:
-            helpers.bulk(es,actions)
-            print("Indexed batch of", len(actions))
-            actions = []
-    print(f"No resource links found for {noresourcelinks} RFPs")
+    state = IndexState(INDEX_STATE_PATH) if incremental else None
+    trusted = state is not None and state.check_index(index_uuid(es, layout), notice_count(es))
+    if state is not None and not trusted:
+        print("No index state for this index, indexing every notice")
 
-    if actions:
-        helpers.bulk(es, actions)
-        print("Indexd final batch of", len(actions))
+    def changed_opps():
+        # Unchanged notices are dropped before fetch_documents: no download, no Tika, no bulk action.
+        # So are the ones already past the 1 month window, they would only be deleted again below
+        nonlocal unchanged
+        for item in opps:
+            if trusted and (state.unchanged(item) or too_old(item.get("postedDate"), months=1)):
+                unchanged += 1
+                continue
+            yield item
+
+    def index_actions():
+        nonlocal noresourcelinks
+        for item, texts in fetch_documents(changed_opps()):
+            if not item.get("resourceLinks"):
+                noresourcelinks += 1
+            indexed.append((item, "" not in texts)) # "" = download failed, retried next run
+            if layout == "chunks":
+                yield build_action(item, texts, with_pdfs=False)
+                actions, chunk_counts[item.get("noticeId")] = chunk_actions(item, texts)
+                yield from actions
+            else:
+                yield build_action(item, texts)
+
+    # Bumped before and after the index changes: cached searches are dropped even if this run dies halfway
+    bump_generation()
+    stats = bulk_index(es, index_actions())
+    # Chunk ids are <noticeId>:<chunk>, a failed chunk means its notice was not fully indexed
+    failed_docs = set(stats["failed_ids"])
+    failed_notices = {doc_id.rsplit(":", 1)[0] for doc_id in failed_docs}
+    if chunk_counts:
+        remove_stale_chunks(es, chunk_counts)
+    print(f"No resource links found for {noresourcelinks} RFPs")
+    if attachment_cache is not None:
+        attachment_cache.save()
+        print(attachment_cache.stats())
+    if state is not None:
+        print(f"Skipped {unchanged} unchanged or expired RFPs")
+        for item, complete in indexed:
+            notice_id = item.get("noticeId")
+            if notice_id not in failed_docs: # the notice document is in the index
+                state.record(item, complete and notice_id not in failed_notices)
     print("Done Indexing.")
 
-    es.delete_by_query(
-        index="sam_opportunities_v1",
-        body={
-            "query": {
-                "range": {
-                    "postedDate": {
-                        "lt": "now-1M"  # 2 months before today
+    if trusted:
+        # Every notice in the index is in the state, so expired ones are deleted by ID
+        expired = state.expired(months=1)
+        failed_ids = set()
+        if expired:
+            deletes = ({"_op_type": "delete", "_index": INDEX_NAME, "_id": notice_id} for notice_id in expired)
+            failed_ids = bulk_index(es, deletes)["failed_ids"]
+            if layout == "chunks":
+                remove_notice_chunks(es, expired)
+        for notice_id in expired:
+            if notice_id not in failed_ids:
+                state.forget(notice_id)
+        print(f"Removed {len(expired) - len(failed_ids)} documents older than 1 months.")
+    else:
+        es.delete_by_query(
+            index=f"sam_opportunities_v1,{CHUNK_INDEX_NAME}" if layout == "chunks" else "sam_opportunities_v1",
+            body={
+                "query": {
+                    "range": {
+                        "postedDate": {
+                            "lt": "now-1M"  # 2 months before today
+                        }
                     }
                 }
             }
-        }
-    )
-    print("Removed documents older than 1 months.")
\ No newline at end of file
+        )
+        print("Removed documents older than 1 months.")
+        if state is not None:
+            # The index also holds notices of earlier runs: the state is rebuilt from it so the next run can trust it
+            state.rebuild(indexed_notices(es))
+            print(f"Index state rebuilt from the index: {len(state.notices)} notices")
+
+    bump_generation()
+    if state is not None:
+        state.index_uuid = index_uuid(es, layout)
+        state.save()
@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+import calendar
+from datetime import date
+
+class IndexState:
+    # What the last runs of index_rfps put in the index, so unchanged notices can be skipped:
+    #   index_state.json - noticeId -> fingerprint and postedDate of the indexed version (fingerprint null
+    #                      when some of its attachments were missing: indexed, but retried next run),
+    #                      plus the uuid of the ES index they were indexed into (a recreated index starts over)
+    def __init__(self, path):
+        self.path = path
+        self.index_uuid = None
+        self.notices = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as r:
+                state = json.load(r)
+            self.index_uuid = state["index_uuid"]
+            self.notices = state["notices"]
+
+    @staticmethod
+    def fingerprint(item):
+        # Modification date, the set of attachment links and the description: anything else
+        # SAM.gov changes on a notice comes with a new modification date
+        description = item.get("description") or ""
+        parts = {
+            "modified": item.get("modifiedDate") or item.get("postedDate"),
+            "deadline": item.get("responseDeadLine"),
+            "links": sorted(set(item.get("resourceLinks") or [])),
+            "description": hashlib.sha1(description.encode("utf-8")).hexdigest(),
+        }
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def check_index(self, index_uuid, notice_count=None):
+        # False when the index is missing, was deleted / recreated since the state was written, or is empty
+        # while notices are recorded (emptied with delete_by_query): nothing recorded can be trusted then,
+        # everything is indexed again
+        if index_uuid is None or index_uuid != self.index_uuid or (notice_count == 0 and self.notices):
+            self.notices = {}
+            return False
+        return True
+
+    def unchanged(self, item):
+        entry = self.notices.get(item.get("noticeId"))
+        return entry is not None and entry["fingerprint"] == self.fingerprint(item)
+
+    def record(self, item, complete=True):
+        # Every notice in the index is recorded, so expired() can prune it; incomplete ones never match unchanged()
+        self.notices[item.get("noticeId")] = {
+            "fingerprint": self.fingerprint(item) if complete else None,
+            "postedDate": item.get("postedDate"),
+        }
+
+    def rebuild(self, indexed):
+        # indexed: (noticeId, postedDate) of every notice document in the index. Notices indexed by earlier
+        # runs (other searches, older pulls) are recorded without fingerprint: pruned when they expire,
+        # indexed again if they come back in step 1
+        self.notices = {
+            notice_id: self.notices.get(notice_id) or {"fingerprint": None, "postedDate": posted_date}
+            for notice_id, posted_date in indexed
+        }
+
+    def forget(self, notice_id):
+        self.notices.pop(notice_id, None)
+
+    def expired(self, months=1, today=None):
+        # noticeIds posted before the same day `months` months ago (ES "now-1M")
+        return [notice_id for notice_id, entry in self.notices.items() if too_old(entry["postedDate"], months, today)]
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as w:
+            json.dump({"index_uuid": self.index_uuid, "notices": self.notices}, w)
+        os.replace(tmp_path, self.path)
+
+def too_old(posted_date, months=1, today=None):
+    posted = _posted_date(posted_date)
+    return posted is not None and posted < _months_before(today or date.today(), months)
+
+def _posted_date(value):
+    # SAM.gov dates start with YYYY-MM-DD, sometimes followed by a time
+    try:
+        return date.fromisoformat(value[:10])
+    except (TypeError, ValueError):
+        return None
+
+def _months_before(day, months):
+    month_index = day.year * 12 + day.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
@@ -2,15 +2,228 @@
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module='tika')
 
+import os
+import sys
 import csv
 import json
+import time
+import gzip
+import queue
+import atexit
+import random
+import hashlib
+import threading
 from elasticsearch import Elasticsearch
+try:
+    from chunk_layout import CHUNK_INDEX_NAME
+    from index_generation import read_generation
+except ImportError: # imported as elastic_search.main (benchmarks)
+    from elastic_search.chunk_layout import CHUNK_INDEX_NAME
+    from elastic_search.index_generation import read_generation
 
 ES_HOST = "http://localhost:9201"
 INDEX_NAME = "sam_opportunities_v1"
+SEARCH_LAYOUT = "nested" # must match INDEX_LAYOUT in index_pdf_and_docs.py: "nested" or "chunks"
+CHUNK_HITS_PER_NOTICE = 5 # best matching chunks shown per notice in the chunks layout
+PAGE_SIZE = 500 # hits per request when paging through a large result set
+PIT_KEEP_ALIVE = "2m" # how long the point in time survives between two pages
+STREAM_THRESHOLD = 1000 # interactive searches asking for more results than this are streamed to the CSV
+USE_SEARCH_CACHE = True # answer a search run again before the index changed from the local cache
+SEARCH_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_cache")
+SEARCH_CACHE_TTL = 6 * 60 * 60 # seconds; also bounds staleness when the index changed without index_rfps
+SEARCH_CACHE_MAX_BYTES = 200 * 1024 * 1024
+DEBUG_CAPTURE = False # save raw ES responses for debugging
+DEBUG_CAPTURE_PERCENT = 100 # share of searches captured when DEBUG_CAPTURE is on
+DEBUG_CAPTURE_FOLDER = "es_responses"
+DEBUG_CAPTURE_COMPRESS = True # .json.gz instead of .json
+DEBUG_CAPTURE_MAX_BYTES = 100 * 1024 * 1024 # oldest captures deleted past this
 
 es = Elasticsearch(ES_HOST)
 
+class SearchCache:
+    # Results of earlier searches, kept across runs so a search repeated before the index changes
+    # does not reach ES:
+    #   entries/<key>.json - the results of one search
+    #   index.json - key -> size, creation time and last use (LRU eviction past max_bytes),
+    #                plus hit / miss counts
+    # Keys cover the normalized query body, size, sort order, layout and index generation
+    def __init__(self, folder, ttl=SEARCH_CACHE_TTL, max_bytes=SEARCH_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries_folder = os.path.join(folder, "entries")
+        self.index_path = os.path.join(folder, "index.json")
+        self.entries = {}
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.loaded = False
+
+    def _load(self):
+        self.loaded = True
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as r:
+                index = json.load(r)
+        except ValueError:
+            return
+        self.entries = index["entries"]
+        self.clock = index["clock"]
+        self.hits = index["hits"]
+        self.misses = index["misses"]
+
+    def _path(self, key):
+        return os.path.join(self.entries_folder, f"{key}.json")
+
+    @staticmethod
+    def key(**parts):
+        # Same search -> same key whatever the dict order or the spacing around keywords
+        parts["generation"] = read_generation() # bumped by index_rfps, create_index.py and delete_all_index.py
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if not self.loaded:
+            self._load()
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry["created"] <= self.ttl:
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as r:
+                    results = json.load(r)
+            except (OSError, ValueError):
+                results = None
+            if results is not None:
+                self.clock += 1
+                entry["used"] = self.clock
+                self.hits += 1
+                self._save()
+                return results
+        if entry is not None:
+            self._remove(key)
+        self.misses += 1
+        self._save()
+        return None
+
+    def put(self, key, results):
+        if not self.loaded:
+            self._load()
+        data = json.dumps(results).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(self.entries_folder, exist_ok=True)
+        with open(self._path(key), "wb") as w:
+            w.write(data)
+        self.clock += 1
+        self.entries[key] = {"size": len(data), "created": time.time(), "used": self.clock}
+        self._evict()
+        self._save()
+
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if now - entry["created"] > self.ttl]:
+            self._remove(key)
+        total = sum(entry["size"] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda key: self.entries[key]["used"]):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries[key]["size"]
+            self._remove(key)
+
+    def _save(self):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as w:
+            json.dump({"clock": self.clock, "hits": self.hits, "misses": self.misses, "entries": self.entries}, w)
+        os.replace(tmp_path, self.index_path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0
+        return f"Search cache: {self.hits}/{lookups} hits ({rate:.0f}%), {len(self.entries)} searches cached"
+
+search_cache = SearchCache(SEARCH_CACHE_FOLDER) if USE_SEARCH_CACHE else None
+
+class ResponseCapture:
+    # Raw ES responses of a sample of searches, written by a background thread so searches never wait
+    # on the disk: <folder>/<time>_<n>_<kind>.json[.gz] with the request body and the response, compact.
+    # The folder is kept under max_bytes by deleting the oldest captures; captures are dropped rather
+    # than queued without bound when the writer falls behind
+    def __init__(self, folder, percent=100, compress=True, max_bytes=DEBUG_CAPTURE_MAX_BYTES, max_pending=16):
+        self.folder = folder
+        self.percent = percent
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.thread = None
+        self.count = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def capture(self, kind, body, response):
+        if random.random() * 100 >= self.percent:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._writer, daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+            self.count += 1
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}_{self.count:05d}_{kind}.json"
+        try:
+            # body is copied: iter_search_rfps reuses it for the next page
+            self.pending.put_nowait((name, dict(body), dict(response)))
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer(self):
+        os.makedirs(self.folder, exist_ok=True)
+        while True:
+            name, body, response = self.pending.get()
+            try:
+                data = json.dumps({"request": body, "response": response}, separators=(",", ":")).encode("utf-8")
+                if self.compress:
+                    name += ".gz"
+                    data = gzip.compress(data, compresslevel=5)
+                with open(os.path.join(self.folder, name), "wb") as w:
+                    w.write(data)
+                self._rotate()
+            except (OSError, TypeError, ValueError) as e:
+                print(f"[WARN] Could not capture ES response {name}: {e}")
+            finally:
+                self.pending.task_done()
+
+    def _rotate(self):
+        # Names start with the capture time, so sorted names are oldest first
+        files = [os.path.join(self.folder, name) for name in sorted(os.listdir(self.folder))]
+        sizes = [os.path.getsize(path) for path in files]
+        total = sum(sizes)
+        for path, size in zip(files, sizes):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def flush(self):
+        # Waits for the captures still queued, called at exit
+        if self.thread is not None:
+            self.pending.join()
+
+response_capture = ResponseCapture(DEBUG_CAPTURE_FOLDER, DEBUG_CAPTURE_PERCENT, DEBUG_CAPTURE_COMPRESS) if DEBUG_CAPTURE else None
+
+def capture_response(kind, body, response):
+    if response_capture is not None:
+        response_capture.capture(kind, body, response)
+
+def normalized_keywords(keywords):
+    return [" ".join(kw.split()) for kw in keywords if kw.strip()]
+
 def build_query(keywords, naics_code=None, classification_code=None, match_type="lenient", operator="or"):
     must_filters = []
     keyword_clauses = []
@@ -95,8 +308,8 @@ def build_query(keywords, naics_code=None, classification_code=None, match_type=
 
     return bool_query
 
-def search_rfps(keywords, match_type="lenient", operator="or", size=20, sort_by="relevance", naics_code=None, classification_code=None):
-    query_body = {
+def build_search_body(keywords, match_type="lenient", operator="or", naics_code=None, classification_code=None):
+    return {
     "query": build_query(keywords, naics_code, classification_code, match_type, operator),
     "highlight": {
         "require_field_match": False,
@@ -109,14 +322,54 @@ def search_rfps(keywords, match_type="lenient", operator="or", size=20, sort_by=
         }
     }
 
+def search_rfps(keywords, match_type="lenient", operator="or", size=20, sort_by="relevance", naics_code=None, classification_code=None):
+    # The same normalized keywords for the query and the cache key: an empty keyword ("a, b,") would add a
+    # clause matching nothing to the query
+    keywords = normalized_keywords(keywords)
+    query_body = build_search_body(keywords, match_type, operator, naics_code, classification_code)
+
+    cache_key = None
+    if search_cache is not None:
+        cache_key = search_cache.key(
+            layout="nested", index=INDEX_NAME, keywords=keywords, body=query_body, size=size, sort_by=sort_by,
+        )
+        results = search_cache.get(cache_key)
+        if results is not None:
+            return results
+
     response = es.search(index=INDEX_NAME, body=query_body, size=size)
-    response_dict = dict(response)  # works in v8+ clients
+    capture_response("search", query_body, response)
 
-    ES_DUMP = "es_response.json"
-    with open(ES_DUMP, "w", encoding="utf-8") as w:
-        json.dump(response_dict, w, indent=2)
+    results = results_from_response(response, keywords, sort_by)
+    if cache_key is not None:
+        search_cache.put(cache_key, results)
+    return results
 
+class KeywordMatcher:
+    # Which keywords appear in highlight fragments (case-insensitive substring, same as kw.lower() in frag.lower()).
+    # Keywords are lowered once, the fragments of a field once (joined), and keywords already matched
+    # earlier in the hit are not searched again. Plain `in` on the lowered text beats a combined regex
+    # here: re tries every alternative at every position, `in` is a fast C substring search
+    def __init__(self, keywords):
+        self.originals = {} # lowered keyword -> keywords as typed
+        for kw in keywords:
+            self.originals.setdefault(kw.lower(), []).append(kw)
+
+    def matches(self, fragments, matched=()):
+        # Keywords found in fragments, leaving out those in matched
+        found = set()
+        if not fragments:
+            return found
+        # NUL never appears in a keyword, so no match spans two fragments
+        text = "\0".join(fragments).lower()
+        for kw, originals in self.originals.items():
+            if originals[0] not in matched and kw in text:
+                found.update(originals)
+        return found
+
+def results_from_response(response, keywords, sort_by="relevance"):
     results = []
+    matcher = KeywordMatcher(keywords)
 
     for hit in response["hits"]["hits"]:
         source = hit["_source"]
@@ -135,7 +388,7 @@ def search_rfps(keywords, match_type="lenient", operator="or", size=20, sort_by=
         for field_name, fragments in highlights.items():
             if fragments:
                 fields_matched.add(field_name)
-                matched_keywords.update([kw for kw in keywords if any(kw.lower() in frag.lower() for frag in fragments)])
+                matched_keywords.update(matcher.matches(fragments, matched_keywords))
                 total_occurrences += len(fragments)
                 for frag in fragments:
                     all_snippet_fragments.append(f"{field_name}: {frag}")
@@ -152,46 +405,397 @@ def search_rfps(keywords, match_type="lenient", operator="or", size=20, sort_by=
                 fields_matched.add("pdfs.pdf_text")
                 pdfs_with_hits.append(f"{pdf_title} ({pdf_url})")
                 pdf_hit_counts.append(len(fragments))
-                matched_keywords.update([kw for kw in keywords if any(kw.lower() in frag.lower() for frag in fragments)])
+                matched_keywords.update(matcher.matches(fragments, matched_keywords))
                 total_occurrences += len(fragments)
                 for frag in fragments:
                     all_snippet_fragments.append(f"PDF: {pdf_title} ({pdf_url}): {frag}")
 
-        # Point of Contact
-        poc_list = []
-        for poc in source.get("pointOfContact", []):
-            contact_info = " | ".join(filter(None, [
-                poc.get("fullName"),
-                poc.get("title"),
-                poc.get("email"),
-                poc.get("phone")
-            ]))
-            if contact_info:
-                poc_list.append(contact_info)
-        point_of_contact = " ; ".join(poc_list)
-
-        results.append({
-            "noticeId": source.get("noticeId"),
-            "title": source.get("title"),
-            "uiLink": source.get("uiLink"),
-            "naicsCode": source.get("naicsCode"),
-            "classificationCode": source.get("classificationCode"),
-            "responseDeadLine": source.get("responseDeadLine", ""),
-            "typeOfSetAsideDescription": source.get("typeOfSetAsideDescription", ""),
-            "relevant_keywords": ", ".join(sorted(matched_keywords)),
-            "total_keyword_hits": total_occurrences,
-            "fields_matched": ", ".join(sorted(fields_matched)),
-            "pdfs_with_hits": "; ".join(pdfs_with_hits),
-            "pdf_hit_counts": "; ".join(map(str, pdf_hit_counts)),
-            "pointOfContact": point_of_contact,
-            "snippets": " ... ".join(all_snippet_fragments)
-        })
+        results.append(build_result(
+            source, matched_keywords, total_occurrences, fields_matched, pdfs_with_hits, pdf_hit_counts, all_snippet_fragments
+        ))
 
     if sort_by == "occurrences":
         results.sort(key=lambda x: x["total_keyword_hits"], reverse=True)
 
     return results
 
+def build_result(source, matched_keywords, total_occurrences, fields_matched, pdfs_with_hits, pdf_hit_counts, snippet_fragments):
+    # Point of Contact
+    poc_list = []
+    for poc in source.get("pointOfContact", []):
+        contact_info = " | ".join(filter(None, [
+            poc.get("fullName"),
+            poc.get("title"),
+            poc.get("email"),
+            poc.get("phone")
+        ]))
+        if contact_info:
+            poc_list.append(contact_info)
+    point_of_contact = " ; ".join(poc_list)
+
+    return {
+        "noticeId": source.get("noticeId"),
+        "title": source.get("title"),
+        "uiLink": source.get("uiLink"),
+        "naicsCode": source.get("naicsCode"),
+        "classificationCode": source.get("classificationCode"),
+        "responseDeadLine": source.get("responseDeadLine", ""),
+        "typeOfSetAsideDescription": source.get("typeOfSetAsideDescription", ""),
+        "relevant_keywords": ", ".join(sorted(matched_keywords)),
+        "total_keyword_hits": total_occurrences,
+        "fields_matched": ", ".join(sorted(fields_matched)),
+        "pdfs_with_hits": "; ".join(pdfs_with_hits),
+        "pdf_hit_counts": "; ".join(map(str, pdf_hit_counts)),
+        "pointOfContact": point_of_contact,
+        "snippets": " ... ".join(snippet_fragments)
+    }
+
+# -----------------------------------------
+# CHUNKS LAYOUT
+# Notices in INDEX_NAME without pdfs, attachment text as passage documents in CHUNK_INDEX_NAME.
+# Both indices are searched at once and collapsed on noticeId, one hit per notice.
+# Differences with build_query: with operator "and" all keywords must appear in the same passage
+# (or in the title / description), and negative keywords are resolved to noticeIds by a first query
+# -----------------------------------------
+def keyword_match(term, fields, match_type, operator):
+    return {
+        "multi_match": {
+            "query": term,
+            "fields": fields,
+            "type": "phrase" if match_type == "exact" else "best_fields",
+            "operator": "and" if operator == "and" else "or",
+            **({"fuzziness": "AUTO"} if match_type == "lenient" else {})
+        }
+    }
+
+CHUNK_SEARCH_FIELDS = ["title", "description_text", "chunk_text", "pdf_title"]
+
+def code_filter(field, value):
+    # keyword in the chunk index, dynamically mapped (.keyword) in the notice index
+    return {"bool": {"should": [{"term": {field: value}}, {"term": {f"{field}.keyword": value}}]}}
+
+def excluded_notices_body(terms, match_type="lenient", operator="or", limit=10000):
+    # noticeIds with any of terms in the notice or in one of its chunks
+    return {
+        "query": {"bool": {"should": [keyword_match(t, CHUNK_SEARCH_FIELDS, match_type, operator) for t in terms]}},
+        "collapse": {"field": "noticeId"},
+        "_source": False,
+        "size": limit,
+    }
+
+def collapsed_notice_ids(response):
+    return [hit["fields"]["noticeId"][0] for hit in response["hits"]["hits"]]
+
+def notices_matching(terms, match_type="lenient", operator="or", limit=10000):
+    response = es.search(index=f"{INDEX_NAME},{CHUNK_INDEX_NAME}", body=excluded_notices_body(terms, match_type, operator, limit))
+    return collapsed_notice_ids(response)
+
+def notice_sources(notice_ids):
+    # noticeId -> notice document (without pdfs), one mget for all of them
+    sources = {}
+    if notice_ids:
+        for doc in es.mget(index=INDEX_NAME, ids=list(notice_ids), source_excludes=["pdfs"])["docs"]:
+            if doc.get("found"):
+                sources[doc["_id"]] = doc["_source"]
+    return sources
+
+def negative_terms(keywords):
+    return [kw[4:] for kw in keywords if kw.lower().startswith("not ")]
+
+def build_chunk_query(keywords, naics_code=None, classification_code=None, match_type="lenient", operator="or", excluded_notices=()):
+    filters = []
+    if naics_code:
+        filters.append(code_filter("naicsCode", naics_code))
+    if classification_code:
+        filters.append(code_filter("classificationCode", classification_code))
+
+    keyword_clauses = []
+    for kw in keywords:
+        if not kw.lower().startswith("not "):
+            keyword_clauses.append(keyword_match(kw, CHUNK_SEARCH_FIELDS, match_type, operator))
+
+    bool_query = {"bool": {"filter": filters}}
+    if excluded_notices:
+        bool_query["bool"]["must_not"] = [{"terms": {"noticeId": list(excluded_notices)}}]
+    if keyword_clauses:
+        if operator == "and":
+            bool_query["bool"]["must"] = keyword_clauses
+        else:
+            bool_query["bool"]["should"] = keyword_clauses
+            bool_query["bool"]["minimum_should_match"] = 1
+    return bool_query
+
+def build_chunk_search_body(keywords, match_type="lenient", operator="or", naics_code=None, classification_code=None, excluded_notices=()):
+    return {
+        "query": build_chunk_query(keywords, naics_code, classification_code, match_type, operator, excluded_notices),
+        "collapse": {
+            "field": "noticeId",
+            "inner_hits": {
+                "name": "matches",
+                "size": CHUNK_HITS_PER_NOTICE,
+                "_source": ["pdf_url", "pdf_title", "offset"],
+                "highlight": {
+                    "require_field_match": False,
+                    "fields": {
+                        "title": {"fragment_size": 200, "number_of_fragments": 3},
+                        "description_text": {"fragment_size": 200, "number_of_fragments": 3},
+                        "chunk_text": {"fragment_size": 200, "number_of_fragments": 2}
+                    }
+                }
+            }
+        },
+        "_source": False,
+    }
+
+def search_rfps_chunks(keywords, match_type="lenient", operator="or", size=20, sort_by="relevance", naics_code=None, classification_code=None):
+    # Same results as search_rfps, for the chunks layout
+    keywords = normalized_keywords(keywords)
+    cache_key = None
+    if search_cache is not None:
+        # Keyed on the negative keywords rather than the noticeIds they exclude, known only after a search
+        cache_key = search_cache.key(
+            layout="chunks", index=[INDEX_NAME, CHUNK_INDEX_NAME], keywords=keywords,
+            body=build_chunk_search_body(keywords, match_type, operator, naics_code, classification_code),
+            size=size, sort_by=sort_by,
+        )
+        results = search_cache.get(cache_key)
+        if results is not None:
+            return results
+
+    negative = negative_terms(keywords)
+    excluded = notices_matching(negative, match_type, operator) if negative else []
+
+    query_body = build_chunk_search_body(keywords, match_type, operator, naics_code, classification_code, excluded)
+    response = es.search(index=f"{INDEX_NAME},{CHUNK_INDEX_NAME}", body=query_body, size=size)
+    capture_response("chunks", query_body, response)
+    results = results_from_chunk_response(response, keywords, notice_sources(collapsed_notice_ids(response)), sort_by)
+    if cache_key is not None:
+        search_cache.put(cache_key, results)
+    return results
+
+def results_from_chunk_response(response, keywords, sources, sort_by="relevance"):
+    # sources: noticeId -> notice document, see notice_sources
+    results = []
+    matcher = KeywordMatcher([kw for kw in keywords if not kw.lower().startswith("not ")])
+    for hit in response["hits"]["hits"]:
+        notice_id = hit["fields"]["noticeId"][0]
+        matched_keywords = set()
+        fields_matched = set()
+        pdf_hits = {} # "title (url)" -> fragments, in order of best chunk
+        total_occurrences = 0
+        all_snippet_fragments = []
+
+        for match in hit["inner_hits"]["matches"]["hits"]["hits"]:
+            for field_name, fragments in match.get("highlight", {}).items():
+                matched_keywords.update(matcher.matches(fragments, matched_keywords))
+                total_occurrences += len(fragments)
+                if field_name == "chunk_text":
+                    fields_matched.add("pdfs.pdf_text")
+                    label = f"{match['_source'].get('pdf_title', 'Unknown PDF')} ({match['_source'].get('pdf_url', '')})"
+                    pdf_hits[label] = pdf_hits.get(label, 0) + len(fragments)
+                    all_snippet_fragments.extend(f"PDF: {label}: {frag}" for frag in fragments)
+                else:
+                    fields_matched.add(field_name)
+                    all_snippet_fragments.extend(f"{field_name}: {frag}" for frag in fragments)
+
+        source = sources.get(notice_id, {"noticeId": notice_id})
+        results.append(build_result(
+            source, matched_keywords, total_occurrences, fields_matched, list(pdf_hits), list(pdf_hits.values()), all_snippet_fragments
+        ))
+
+    if sort_by == "occurrences":
+        results.sort(key=lambda x: x["total_keyword_hits"], reverse=True)
+
+    return results
+
+# -----------------------------------------
+# BATCH SEARCH
+# Many saved profiles in one _msearch round trip (two in the chunks layout when profiles have
+# negative keywords), hits of all profiles post-processed concurrently
+# -----------------------------------------
+def load_profiles(path):
+    # JSON list of {"name", "keywords", and optionally "naics_code", "classification_code",
+    # "match_type", "operator", "size", "sort_by"}; keywords may be a list or a comma separated string
+    with open(path, "r", encoding="utf-8") as r:
+        profiles = json.load(r)
+    for i, profile in enumerate(profiles):
+        profile.setdefault("name", f"profile_{i + 1}")
+        if isinstance(profile["keywords"], str):
+            profile["keywords"] = [kw.strip() for kw in profile["keywords"].split(",")]
+    return profiles
+
+def profile_options(profile):
+    return {
+        "match_type": profile.get("match_type", "lenient"),
+        "operator": profile.get("operator", "or"),
+        "naics_code": profile.get("naics_code"),
+        "classification_code": profile.get("classification_code"),
+    }
+
+def msearch(index, bodies):
+    # One _msearch for all bodies, responses in the same order
+    searches = []
+    for body in bodies:
+        searches.append({"index": index})
+        searches.append(body)
+    return es.msearch(searches=searches)["responses"]
+
+def search_profiles(profiles, layout=SEARCH_LAYOUT):
+    # Returns ([{"name", "results", "error", "took_ms", "processing_ms"} per profile], {"search_ms", "total_ms"})
+    start = time.perf_counter()
+    chunks = layout == "chunks"
+    index = f"{INDEX_NAME},{CHUNK_INDEX_NAME}" if chunks else INDEX_NAME
+
+    excluded = [[] for _ in profiles]
+    if chunks:
+        with_negatives = [i for i, p in enumerate(profiles) if negative_terms(p["keywords"])]
+        if with_negatives:
+            bodies = [
+                excluded_notices_body(negative_terms(profiles[i]["keywords"]), profiles[i].get("match_type", "lenient"), profiles[i].get("operator", "or"))
+                for i in with_negatives
+            ]
+            for i, response in zip(with_negatives, msearch(index, bodies)):
+                if "error" not in response:
+                    excluded[i] = collapsed_notice_ids(response)
+
+    bodies = []
+    for profile, excluded_notices in zip(profiles, excluded):
+        options = profile_options(profile)
+        if chunks:
+            body = build_chunk_search_body(profile["keywords"], excluded_notices=excluded_notices, **options)
+        else:
+            body = build_search_body(profile["keywords"], **options)
+        body["size"] = profile.get("size", 20)
+        bodies.append(body)
+    responses = msearch(index, bodies)
+    for body, response in zip(bodies, responses):
+        capture_response("profile", body, response)
+
+    sources = {}
+    if chunks:
+        notice_ids = {notice_id for response in responses if "error" not in response for notice_id in collapsed_notice_ids(response)}
+        sources = notice_sources(notice_ids)
+    search_ms = (time.perf_counter() - start) * 1000
+
+    def process(profile, response):
+        entry = {"name": profile["name"], "results": [], "error": None, "took_ms": response.get("took"), "processing_ms": 0.0}
+        if "error" in response:
+            entry["error"] = response["error"].get("reason") if isinstance(response["error"], dict) else str(response["error"])
+            return entry
+        processing_start = time.perf_counter()
+        sort_by = profile.get("sort_by", "relevance")
+        if chunks:
+            entry["results"] = results_from_chunk_response(response, profile["keywords"], sources, sort_by)
+        else:
+            entry["results"] = results_from_response(response, profile["keywords"], sort_by)
+        entry["processing_ms"] = (time.perf_counter() - processing_start) * 1000
+        return entry
+
+    # One after the other: hit processing is pure Python, threads would only contend for the GIL
+    per_profile = [process(profile, response) for profile, response in zip(profiles, responses)]
+
+    return per_profile, {"search_ms": search_ms, "total_ms": (time.perf_counter() - start) * 1000}
+
+# -----------------------------------------
+# DEEP PAGINATION
+# Large result sets read page by page on a point in time with search_after, so results come out as
+# a generator and memory stays at one page whatever the number of results. Results are in relevance
+# order (nested layout) or noticeId order (chunks layout: collapse only pages when sorted on noticeId)
+# -----------------------------------------
+def iter_search_rfps(keywords, match_type="lenient", operator="or", naics_code=None, classification_code=None, limit=None, layout=SEARCH_LAYOUT, page_size=PAGE_SIZE):
+    chunks = layout == "chunks"
+    if chunks:
+        negative = negative_terms(keywords)
+        excluded = notices_matching(negative, match_type, operator) if negative else []
+        body = build_chunk_search_body(keywords, match_type, operator, naics_code, classification_code, excluded)
+        body["sort"] = [{"noticeId": "asc"}]
+        pit_index = f"{INDEX_NAME},{CHUNK_INDEX_NAME}"
+    else:
+        body = build_search_body(keywords, match_type, operator, naics_code, classification_code)
+        body["sort"] = [{"_score": "desc"}, {"_shard_doc": "asc"}]
+        pit_index = INDEX_NAME
+    body["track_total_hits"] = False
+
+    pit_id = es.open_point_in_time(index=pit_index, keep_alive=PIT_KEEP_ALIVE)["id"]
+    returned = 0
+    try:
+        while limit is None or returned < limit:
+            body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+            body["size"] = page_size if limit is None else min(page_size, limit - returned)
+            response = es.search(body=body)
+            capture_response("page", body, response)
+            pit_id = response.get("pit_id", pit_id)
+            hits = response["hits"]["hits"]
+            if not hits:
+                return
+            if chunks:
+                page = results_from_chunk_response(response, keywords, notice_sources(collapsed_notice_ids(response)))
+            else:
+                page = results_from_response(response, keywords)
+            for result in page:
+                yield result
+            returned += len(hits)
+            if len(hits) < body["size"]:
+                return
+            body["search_after"] = hits[-1]["sort"]
+    finally:
+        es.close_point_in_time(id=pit_id)
+
+def run_profiles(path, output_folder="search_results"):
+    # CLI: python3 main.py --profiles profiles.json, one CSV per profile in output_folder
+    profiles = load_profiles(path)
+    per_profile, timing = search_profiles(profiles)
+    os.makedirs(output_folder, exist_ok=True)
+    for entry in per_profile:
+        if entry["error"]:
+            print(f"{entry['name']}: error {entry['error']}")
+            continue
+        csv_file = os.path.join(output_folder, f"{entry['name']}.csv")
+        write_results_csv(csv_file, entry["results"])
+        print(f"{entry['name']}: {len(entry['results'])} results (ES {entry['took_ms']}ms, processing {entry['processing_ms']:.0f}ms) -> {csv_file}")
+    print(f"{len(profiles)} profiles in {timing['total_ms']:.0f}ms (search {timing['search_ms']:.0f}ms)")
+
+def write_results_csv(csv_file, results):
+    # results may be a generator (iter_search_rfps): rows are written as they come; returns the row count
+    count = 0
+    with open(csv_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "noticeId",
+            "title",
+            "uiLink",
+            "naicsCode",
+            "classificationCode",
+            "responseDeadLine",
+            "typeOfSetAsideDescription",
+            "pointOfContact",
+            "relevant_keywords",
+            "total_keyword_hits",
+            "fields_matched",
+            "pdfs_with_hits",
+            "pdf_hit_counts",
+            "snippet"
+        ])
+        for r in results:
+            writer.writerow([
+                r["noticeId"],
+                r["title"],
+                r["uiLink"],
+                r["naicsCode"],
+                r["classificationCode"],
+                r["responseDeadLine"],
+                r["typeOfSetAsideDescription"],
+                r["pointOfContact"],
+                r["relevant_keywords"],
+                r["total_keyword_hits"],
+                r["fields_matched"],
+                r["pdfs_with_hits"],
+                r["pdf_hit_counts"],
+                r["snippets"]
+            ])
+            count += 1
+    return count
+
 def interactive_search():
     mode = input("Search mode: normal or custom? ").strip().lower()
     if mode not in ("normal", "custom"):
@@ -228,7 +832,24 @@ def interactive_search():
         size = int(input("Number of results to fetch: ") or 20)
         sort_by = input("Sort by relevance or occurrences? ").strip().lower() == "occurrences" and "occurrences" or "relevance"
 
-    results = search_rfps(
+    if size > STREAM_THRESHOLD:
+        # Too many to print: paged straight into the CSV
+        if sort_by == "occurrences":
+            print("Large result sets are not sorted by occurrences")
+        csv_file = "rfp_search_results.csv"
+        count = write_results_csv(csv_file, iter_search_rfps(
+            keywords,
+            match_type=match_type,
+            operator=operator,
+            naics_code=naics_code,
+            classification_code=classification_code,
+            limit=size
+        ))
+        print(f"{count} results saved to {csv_file}")
+        return
+
+    search = search_rfps_chunks if SEARCH_LAYOUT == "chunks" else search_rfps
+    results = search(
         keywords,
         match_type=match_type,
         operator=operator,
@@ -237,6 +858,8 @@ def interactive_search():
         naics_code=naics_code,
         classification_code=classification_code
     )
+    if search_cache is not None:
+        print(search_cache.stats())
 
     for idx, r in enumerate(results):
         print(f"\nResult {idx+1}: \nTitle: {r['title']}\nNotice ID: ({r['noticeId']})")
@@ -254,43 +877,11 @@ def interactive_search():
     save_csv = input("\nSave results to CSV? (y/n): ").strip().lower()
     if save_csv == "y":
         csv_file = "rfp_search_results.csv"
-        with open(csv_file, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "noticeId",
-                "title",
-                "uiLink",
-                "naicsCode",
-                "classificationCode",
-                "responseDeadLine",
-                "typeOfSetAsideDescription",
-                "pointOfContact",
-                "relevant_keywords",
-                "total_keyword_hits",
-                "fields_matched",
-                "pdfs_with_hits",
-                "pdf_hit_counts",
-                "snippet"
-            ])
-            for r in results:
-                writer.writerow([
-                    r["noticeId"],
-                    r["title"],
-                    r["uiLink"],
-                    r["naicsCode"],
-                    r["classificationCode"],
-                    r["responseDeadLine"],
-                    r["typeOfSetAsideDescription"],
-                    r["pointOfContact"],
-                    r["relevant_keywords"],
-                    r["total_keyword_hits"],
-                    r["fields_matched"],
-                    r["pdfs_with_hits"],
-                    r["pdf_hit_counts"],
-                    r["snippets"]
-                ])
-
+        write_results_csv(csv_file, results)
         print(f"Results saved to {csv_file}")
 
 if __name__ == "__main__":
-    interactive_search()
+    if len(sys.argv) == 3 and sys.argv[1] == "--profiles":
+        run_profiles(sys.argv[2])
+    else:
+        interactive_search()
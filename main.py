@@ -1,10 +1,4 @@
-from elastic_search.extraction_sources.sam_gov import fetch_rfps_from_sam_gov
-from elastic_search.start_elastic_search import start_elastic_search, close_elastic_search
-from elastic_search.index_pdf_and_docs import index_rfps
-from summarizer.summarizer import summarize
-import numpy as np
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers import scan
+# Each step imports only what it uses: selenium, tika and torch (sentence-transformers) take seconds to load
 import csv
 import os
 from datetime import datetime
@@ -37,6 +31,11 @@ description_weight = 4
 aspect_weight = 0.3
 centrality_percentile = 80
 pricing_percentile = 0
+graph_mode = "auto" # knn graph for very large documents, percentile graph otherwise
+summary_workers = os.cpu_count() or 1 # processes clustering documents in parallel during step 3, one BLAS thread each
+stream_step_3 = True # summarize documents as they are scanned from ES instead of going through full text files first
+scan_page_size = 10 # documents per ES scroll page, each can carry megabytes of PDF text
+scan_scroll = "30m" # while streaming the scroll stays open as long as summarizing one page takes
 
 if __name__ == "__main__":
     sys.stdout = sys.__stdout__
@@ -44,6 +43,8 @@ if __name__ == "__main__":
     sys.stdout = Logger(log_f)
 
     if step == "1":
+        from elastic_search.extraction_sources.sam_gov import fetch_rfps_from_sam_gov
+
         sys.stdout = sys.__stdout__
         naic_code = input("Provide naic_code or press enter: ")
         how_back = input("From today to when do you want to pull RFPs in days (number only): ")
@@ -53,6 +54,9 @@ if __name__ == "__main__":
         print("Step 1 complete: SAM.gov RFPs fetched. Manually update JSON with descriptions/links.")
 
     if step == "2":
+        from elastic_search.start_elastic_search import start_elastic_search, close_elastic_search
+        from elastic_search.index_pdf_and_docs import index_rfps
+
         try:
             es, started_container = start_elastic_search()
             index_rfps(es)
@@ -62,6 +66,10 @@ if __name__ == "__main__":
             close_elastic_search(es, started_container)
 
     if step == "3":
+        from elasticsearch.helpers import scan
+        from elastic_search.start_elastic_search import start_elastic_search, close_elastic_search
+        from summarizer.pipeline import summarize_documents, write_atomic
+
         try:
             es, started_container = start_elastic_search()
             OUTPUT_FOLDER = "RFP_Summaries"
@@ -77,7 +85,7 @@ if __name__ == "__main__":
             ]
 
             print(f"Timestamp: {datetime.now()}")
-            print(f"Passage Length: {length} | Edge%={edge_percentile} | Centrality%={centrality_percentile} | "
+            print(f"Passage Length: {length} | Graph={graph_mode} | Edge%={edge_percentile} | Centrality%={centrality_percentile} | "
                 f"Aspect%={aspect_percentile} | Pricing%={pricing_percentile} | Title weight={title_weight} | Aspect weight={aspect_weight}")
             
             # Wait for index to be ready
@@ -101,75 +109,81 @@ if __name__ == "__main__":
                 writer.writeheader()
 
                 # --- Iterate over ES documents ---
-                for doc in scan(es, index=INDEX_NAME, query={"query": {"match_all": {}}}):
-                    source = doc["_source"]
+                def scan_documents():
+                    # Writes each notice's CSV row and yields it for summarization, one ES page in memory at a time
+                    for doc in scan(es, index=INDEX_NAME, query={"query": {"match_all": {}}}, scroll=scan_scroll, size=scan_page_size):
+                        source = doc["_source"]
 
-                    # Base metadata
-                    csv_row = {k: source.get(k, "") for k in metadata_fields}
+                        # Base metadata
+                        csv_row = {k: source.get(k, "") for k in metadata_fields}
 
-                    # Multiple POCs
-                    point_of_contacts = source.get("pointOfContact") or []
-                    csv_row["contact_fullName"] = "\n".join([str(c.get("fullName") or "") for c in point_of_contacts])
-                    csv_row["contact_email"] = "\n".join([str(c.get("email") or "") for c in point_of_contacts])
-                    csv_row["contact_phone"] = "\n".join([str(c.get("phone") or "") for c in point_of_contacts])
+                        # Multiple POCs
+                        point_of_contacts = source.get("pointOfContact") or []
+                        csv_row["contact_fullName"] = "\n".join([str(c.get("fullName") or "") for c in point_of_contacts])
+                        csv_row["contact_email"] = "\n".join([str(c.get("email") or "") for c in point_of_contacts])
+                        csv_row["contact_phone"] = "\n".join([str(c.get("phone") or "") for c in point_of_contacts])
 
-                    # Combine addresses
-                    office_address = source.get("officeAddress") or {}
-                    office_address_str = ", ".join(f"{k}: {str(v)}" for k, v in office_address.items() if v is not None)
+                        # Combine addresses
+                        office_address = source.get("officeAddress") or {}
+                        office_address_str = ", ".join(f"{k}: {str(v)}" for k, v in office_address.items() if v is not None)
 
-                    place_of_performance = source.get("placeOfPerformance") or {}
-                    pop_str = ", ".join(f"{k}: {str(v)}" for k, v in place_of_performance.items() if v is not None)
+                        place_of_performance = source.get("placeOfPerformance") or {}
+                        pop_str = ", ".join(f"{k}: {str(v)}" for k, v in place_of_performance.items() if v is not None)
 
-                    csv_row["address"] = f"Office:{office_address_str}\nPlace of performance:{pop_str}"
+                        csv_row["address"] = f"Office:{office_address_str}\nPlace of performance:{pop_str}"
 
-                    # Write CSV row
-                    writer.writerow(csv_row)
+                        # Write CSV row
+                        writer.writerow(csv_row)
 
-                    # Collect metadata for summarization
-                    title = source.get("title", "")
-                    description = source.get("description", "")
-                    notice_id = source.get("noticeId", "unknown")
+                        # Collect metadata for summarization
+                        title = source.get("title", "")
+                        description = source.get("description", "")
+                        notice_id = source.get("noticeId", "unknown")
 
-                    # Combine all PDFs into a single text
-                    pdfs = source.get("pdfs", [])
-                    combined_text = " | ".join([pdf.get("pdf_text", "") for pdf in pdfs if pdf.get("pdf_text")])
+                        # Combine all PDFs into a single text
+                        pdfs = source.get("pdfs", [])
+                        combined_text = " | ".join([pdf.get("pdf_text", "") for pdf in pdfs if pdf.get("pdf_text")])
 
-                    print(f"\nFull text length for {notice_id}: {len(combined_text)} chars")
+                        print(f"\nFull text length for {notice_id}: {len(combined_text)} chars")
 
-                    rfp_df[notice_id] = {
-                        "title": title,
-                        "description": description
-                    }
+                        yield notice_id, combined_text, title, description
 
-                    all_text_file = os.path.join(OUTPUT_FOLDER, f"{notice_id}.txt")
-                    with open(all_text_file, "w", encoding="utf-8") as f:
-                        f.write(combined_text)
+                if stream_step_3:
+                    # Summaries start with the first ES page and go straight to disk, no full text files in between
+                    for notice_id, summary in summarize_documents(scan_documents(), workers=summary_workers, graph_mode=graph_mode):
+                        write_atomic(os.path.join(OUTPUT_FOLDER, f"{notice_id}.txt"), summary)
+                else:
+                    for notice_id, combined_text, title, description in scan_documents():
+                        rfp_df[notice_id] = {
+                            "title": title,
+                            "description": description
+                        }
+
+                        all_text_file = os.path.join(OUTPUT_FOLDER, f"{notice_id}.txt")
+                        with open(all_text_file, "w", encoding="utf-8") as f:
+                            f.write(combined_text)
 
             close_elastic_search(es, started_container)
 
             # --- Summarize text files ---
-            for file in os.listdir(OUTPUT_FOLDER):
-                if not file.endswith(".txt"):
-                    continue
-
-                notice_id = os.path.splitext(file)[0]
-                file_path = os.path.join(OUTPUT_FOLDER, file)
-
-                with open(file_path, "r", encoding="utf-8") as r:
-                    text = r.read()
-
-                meta = rfp_df.get(notice_id)
-                if not meta:
-                    continue
-
-                summary = summarize(
-                    text,
-                    meta["title"],
-                    meta["description"]
-                )
-
-                with open(file_path, "w", encoding="utf-8") as w:
-                    w.write(summary)
+            def read_documents():
+                for file in os.listdir(OUTPUT_FOLDER):
+                    if not file.endswith(".txt"):
+                        continue
+
+                    notice_id = os.path.splitext(file)[0]
+                    meta = rfp_df.get(notice_id)
+                    if not meta:
+                        continue
+
+                    with open(os.path.join(OUTPUT_FOLDER, file), "r", encoding="utf-8") as r:
+                        text = r.read()
+                    yield notice_id, text, meta["title"], meta["description"]
+
+            if not stream_step_3:
+                # Summaries come back in file order; each one replaces its text file in a single step
+                for notice_id, summary in summarize_documents(read_documents(), workers=summary_workers, graph_mode=graph_mode):
+                    write_atomic(os.path.join(OUTPUT_FOLDER, f"{notice_id}.txt"), summary)
 
         except Exception as e:
             print(f"Error during step 3: {e}")
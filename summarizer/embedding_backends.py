@@ -0,0 +1,130 @@
+# Embedding backends for the summarizer (embedding_backend in summarizer.py). Every backend has the
+# SentenceTransformer.encode call the summarizer and the embedding cache make:
+#   encode(texts, convert_to_numpy=True, normalize_embeddings=False, show_progress_bar=False, batch_size=None)
+# returning a float32 array, one row per text (a single vector for a single string).
+#   "torch"      - SentenceTransformer in float32, the reference
+#   "torch-int8" - the same model with its Linear layers dynamically quantized to int8, CPU only
+#   "onnx"       - the transformer exported to ONNX and run by ONNX Runtime, with the model's mean pooling
+#                  and normalization done in numpy (pip install onnxruntime)
+#   "onnx-int8"  - the ONNX export with int8 weights (onnxruntime.quantization)
+# threads sets the intra-op threads of torch / ONNX Runtime, batch_size the texts per forward pass
+import os
+import json
+import numpy as np
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+onnx_folder = "summarizer/onnx" # exported models, one folder per model name
+
+def load_backend(name, model_name, threads=None, batch_size=32):
+    if name in ("torch", "torch-int8"):
+        return SentenceTransformerBackend(model_name, threads, batch_size, quantize=name == "torch-int8")
+    if name in ("onnx", "onnx-int8"):
+        return OnnxBackend(model_name, threads, batch_size, quantize=name == "onnx-int8")
+    raise ValueError(f"Unknown embedding backend: {name} (expected one of {', '.join(BACKENDS)})")
+
+def _normalize_rows(embeddings):
+    return embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+class SentenceTransformerBackend:
+    def __init__(self, model_name, threads=None, batch_size=32, quantize=False):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            torch.set_num_threads(threads)
+        self.batch_size = batch_size
+        if quantize:
+            # Dynamic quantization: int8 weights, activations quantized on the fly; only runs on CPU
+            model = SentenceTransformer(model_name, device="cpu")
+            self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, show_progress_bar=False, batch_size=None):
+        return self.model.encode(
+            texts, batch_size=batch_size or self.batch_size, convert_to_numpy=True,
+            normalize_embeddings=normalize_embeddings, show_progress_bar=show_progress_bar,
+        )
+
+def export_onnx(model_name, folder):
+    # Writes <folder>/model.onnx (float32), model_int8.onnx, the tokenizer and config.json with what
+    # SentenceTransformer does around the transformer (max_seq_length, pooling, normalization)
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    pooling = [module for module in st_model if isinstance(module, models.Pooling)]
+    if len(pooling) != 1 or pooling[0].get_pooling_mode_str() != "mean":
+        raise ValueError(f"{model_name}: only mean pooling models can be exported")
+
+    os.makedirs(folder, exist_ok=True)
+    sample = tokenizer(["export"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            os.path.join(folder, "model.onnx"),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=14,
+        )
+    quantize_dynamic(os.path.join(folder, "model.onnx"), os.path.join(folder, "model_int8.onnx"), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(folder)
+    config = {
+        "model": model_name,
+        "max_seq_length": st_model.max_seq_length,
+        "normalize": any(isinstance(module, models.Normalize) for module in st_model),
+    }
+    with open(os.path.join(folder, "config.json"), "w", encoding="utf-8") as w:
+        json.dump(config, w)
+
+class OnnxBackend:
+    # The model is exported on first use into onnx_folder and reused afterwards
+    def __init__(self, model_name, threads=None, batch_size=32, quantize=False, folder=None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx embedding backends need onnxruntime: pip install onnxruntime") from None
+        from transformers import AutoTokenizer
+
+        folder = folder or os.path.join(onnx_folder, model_name.replace("/", "__"))
+        if not os.path.exists(os.path.join(folder, "config.json")):
+            print(f"Exporting {model_name} to ONNX in {folder}")
+            export_onnx(model_name, folder)
+        with open(os.path.join(folder, "config.json"), "r", encoding="utf-8") as r:
+            config = json.load(r)
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        path = os.path.join(folder, "model_int8.onnx" if quantize else "model.onnx")
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(folder)
+        self.max_seq_length = config["max_seq_length"]
+        self.normalize = config["normalize"]
+        self.batch_size = batch_size
+
+    def _embed(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np")
+        hidden = self.session.run(["last_hidden_state"], {name: tokens[name].astype(np.int64) for name in self.input_names})[0]
+        # Mean pooling over the real tokens, like sentence_transformers.models.Pooling
+        mask = tokens["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return _normalize_rows(pooled) if self.normalize else pooled
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, show_progress_bar=False, batch_size=None):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        batch_size = batch_size or self.batch_size
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+        if texts:
+            embeddings = np.vstack([self._embed(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]).astype(np.float32)
+        if normalize_embeddings and len(embeddings):
+            embeddings = _normalize_rows(embeddings)
+        return embeddings[0] if single else embeddings
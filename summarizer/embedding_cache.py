@@ -0,0 +1,151 @@
+import os
+import json
+import atexit
+import heapq
+import hashlib
+import numpy as np
+
+class EmbeddingCache:
+    # On-disk cache of passage embeddings, one folder per model:
+    #   vectors.npy - memory-mapped (rows, dim) array of raw (unnormalized) embeddings
+    #   index.json  - sha1(model name + whitespace-normalized text) -> [row, last used]
+    # Once max_rows is reached the least recently used rows are overwritten.
+    def __init__(self, folder, model_name, max_rows=200_000, dtype="float32"):
+        self.folder = os.path.join(folder, model_name.replace("/", "__"))
+        self.model_name = model_name
+        self.max_rows = max_rows
+        self.dtype = np.dtype(dtype)
+        self.vectors_path = os.path.join(self.folder, "vectors.npy")
+        self.index_path = os.path.join(self.folder, "index.json")
+
+        self.vectors = None
+        self.rows = {}
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.loaded = False
+        self.dirty = False
+
+    def _load(self):
+        self.loaded = True
+        # Recency of hits is only written on the next save, so save whatever is left on exit
+        atexit.register(self.save)
+        if not os.path.exists(self.index_path) or not os.path.exists(self.vectors_path):
+            return
+
+        with open(self.index_path, "r", encoding="utf-8") as r:
+            index = json.load(r)
+        if index.get("model") != self.model_name or index.get("dtype") != self.dtype.name:
+            print(f"Embedding cache in {self.folder} was written with other settings, starting over")
+            return
+
+        self.rows = index["rows"]
+        self.clock = index["clock"]
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+
+    def key(self, text):
+        normalized = " ".join(text.split())
+        return hashlib.sha1(f"{self.model_name}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def encode(self, load_model, texts, normalize=False):
+        # Same output as model.encode(texts, convert_to_numpy=True, normalize_embeddings=normalize).
+        # load_model() is only called, and the model only runs, when some texts are not cached yet
+        if not self.loaded:
+            self._load()
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        self.clock += 1
+        keys = [self.key(t) for t in texts]
+        missing = {} # key -> position of its first text
+        cached = []
+        for i, key in enumerate(keys):
+            entry = self.rows.get(key)
+            if entry is None:
+                missing.setdefault(key, i)
+            else:
+                entry[1] = self.clock
+                cached.append(i)
+        self.hits += len(cached)
+        self.misses += len(texts) - len(cached)
+
+        dim = self.vectors.shape[1] if self.vectors is not None else None
+        out = None
+        if cached:
+            # Read hits before storing anything, storing may evict them
+            out = np.empty((len(texts), dim), dtype=np.float32)
+            out[cached] = self.vectors[[self.rows[keys[i]][0] for i in cached]]
+            self.dirty = True
+
+        if missing:
+            fresh = load_model().encode([texts[i] for i in missing.values()], convert_to_numpy=True, show_progress_bar=False)
+            fresh = np.asarray(fresh, dtype=np.float32).reshape(len(missing), -1)
+            if out is None:
+                out = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+            position = {key: j for j, key in enumerate(missing)}
+            uncached = [i for i, key in enumerate(keys) if key in position]
+            out[uncached] = fresh[[position[keys[i]] for i in uncached]]
+            self._store(list(missing), fresh)
+            self.save()
+
+        if out is None:
+            out = np.empty((0, 0), dtype=np.float32)
+        if normalize and len(out):
+            out /= np.linalg.norm(out, axis=1, keepdims=True)
+        return out[0] if single else out
+
+    def _store(self, keys, vectors):
+        if self.vectors is not None and self.vectors.shape[1] != vectors.shape[1]:
+            print(f"Embedding size changed, clearing embedding cache in {self.folder}")
+            self.vectors = None
+            self.rows = {}
+
+        # Anything past max_rows would evict itself, keep the first max_rows
+        keys, vectors = keys[:self.max_rows], vectors[:self.max_rows]
+        rows = self._allocate(len(keys), vectors.shape[1])
+        self.vectors[rows] = vectors
+        for key, row in zip(keys, rows):
+            self.rows[key] = [row, self.clock]
+        self.dirty = True
+
+    def _allocate(self, count, dim):
+        # Rows in use are always 0 .. len(self.rows) - 1: new rows are appended until max_rows,
+        # after that the least recently used entries give up theirs
+        used = len(self.rows)
+        rows = list(range(used, min(used + count, self.max_rows)))
+        evict = count - len(rows)
+        if evict:
+            oldest = heapq.nsmallest(evict, self.rows.items(), key=lambda item: item[1][1])
+            rows += [self.rows.pop(key)[0] for key, _ in oldest]
+        self._reserve(min(used + count, self.max_rows), dim)
+        return rows
+
+    def _reserve(self, needed, dim):
+        capacity = len(self.vectors) if self.vectors is not None else 0
+        if needed <= capacity:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        capacity = min(self.max_rows, max(needed, 2 * capacity, 1024))
+
+        # Grow into a new file, the old memmap has to be closed before it can be replaced (Windows)
+        tmp_path = self.vectors_path + ".tmp.npy"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(capacity, dim))
+        if self.vectors is not None:
+            grown[:len(self.vectors)] = self.vectors
+        grown.flush()
+        del grown
+        self.vectors = None
+        os.replace(tmp_path, self.vectors_path)
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+
+    def save(self):
+        if not self.dirty:
+            return
+        if self.vectors is not None:
+            self.vectors.flush()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as w:
+            json.dump({"model": self.model_name, "dtype": self.dtype.name, "clock": self.clock, "rows": self.rows}, w)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
@@ -0,0 +1,120 @@
+# Step 3 over many documents: passages of several RFPs are encoded together in one large batch,
+# then graph building / Louvain / selection (CPU bound, numpy only) run in a process pool.
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from threadpoolctl import threadpool_limits # installed with scikit-learn
+from summarizer.summarizer import (
+    normalize_text, split_passages, deduplicate, encode_texts, summarize_passages, summary_weights, format_summary, graph_mode,
+)
+
+summary_workers = os.cpu_count() or 1 # each worker runs numpy / BLAS on one thread, see limit_worker_threads
+encode_batch_documents = 16 # documents whose passages go into one model.encode call
+
+def prepare_document(text, title, description):
+    # Normalize + split, with the same early exits as summarize_rfp
+    job = {"title": title, "description": description, "result": None}
+    if not text:
+        job["result"] = "No Text Input"
+        return job
+    text = normalize_text(text)
+    passages, money_passages = split_passages(text)
+    if not passages or not money_passages:
+        job["result"] = "No Passages found"
+        return job
+    passages, counts, money_passages, money_counts = deduplicate(passages, money_passages)
+    job.update(text_length=len(text), passages=passages, money_passages=money_passages, counts=counts, money_counts=money_counts)
+    return job
+
+def encode_jobs(jobs):
+    # One encode call for every title, description and passage of the batch, results scattered back per job
+    texts = []
+    for job in jobs:
+        texts.append(job["title"])
+        if job["description"] is not None:
+            texts.append(job["description"])
+        if job["result"] is None:
+            texts.extend(job["passages"])
+            texts.extend(job["money_passages"])
+
+    embeddings = encode_texts(None, texts)
+    position = 0
+    for job in jobs:
+        job["title_vector"] = _unit(embeddings[position])
+        position += 1
+        job["description_vector"] = None
+        if job["description"] is not None:
+            job["description_vector"] = _unit(embeddings[position])
+            position += 1
+        if job["result"] is None:
+            n, m = len(job["passages"]), len(job["money_passages"])
+            job["embeddings"] = embeddings[position:position + n]
+            job["pricing_embeddings"] = embeddings[position + n:position + n + m]
+            position += n + m
+
+def _unit(vector):
+    # Same as encoding with normalize_embeddings=True
+    return vector / np.linalg.norm(vector)
+
+def summarize_job(job, graph_mode=graph_mode):
+    # Runs in a worker process: everything it needs is in the job, no model involved
+    summary = job["result"]
+    if summary is None:
+        title_weight, description_weight, aspect_weight = summary_weights(job["description"])
+        summary = summarize_passages(
+            job["text_length"], job["passages"], job["money_passages"], job["embeddings"], job["pricing_embeddings"],
+            job["title_vector"], job["description_vector"], title_weight, description_weight, aspect_weight, graph_mode,
+            job["counts"], job["money_counts"]
+        )
+    summary = format_summary(job["description"], summary)
+    print(f"\nSummary length: {len(summary)} chars")
+    return summary
+
+def limit_worker_threads():
+    # Pool initializer: BLAS / OpenMP default to every core in every process, so summary_workers processes
+    # would run summary_workers x cores threads. One thread each, the pool itself uses the cores
+    threadpool_limits(1)
+
+def summarize_documents(documents, workers=summary_workers, batch_documents=encode_batch_documents, graph_mode=graph_mode):
+    # documents: iterable of (notice_id, text, title, description)
+    # Yields (notice_id, summary) in the same order as documents. At most a few batches are in flight,
+    # so memory stays bounded however many documents come in
+    def batches():
+        batch = []
+        for notice_id, text, title, description in documents:
+            batch.append((notice_id, prepare_document(text, title, description)))
+            if len(batch) >= batch_documents:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    if workers <= 1:
+        for batch in batches():
+            encode_jobs([job for _, job in batch])
+            for notice_id, job in batch:
+                yield notice_id, summarize_job(job, graph_mode)
+        return
+
+    max_in_flight = 2 * max(workers, batch_documents)
+    with ProcessPoolExecutor(max_workers=workers, initializer=limit_worker_threads) as pool:
+        pending = deque()
+        for batch in batches():
+            # The model keeps encoding the next batch while the pool clusters the previous ones
+            encode_jobs([job for _, job in batch])
+            for notice_id, job in batch:
+                pending.append((notice_id, pool.submit(summarize_job, job, graph_mode)))
+            while len(pending) > max_in_flight:
+                notice_id, future = pending.popleft()
+                yield notice_id, future.result()
+        while pending:
+            notice_id, future = pending.popleft()
+            yield notice_id, future.result()
+
+def write_atomic(path, text):
+    # Readers never see a half written summary: write next to it, then swap it in
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as w:
+        w.write(text)
+    os.replace(tmp_path, path)
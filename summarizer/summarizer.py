@@ -1,19 +1,34 @@
 # summarize the RFP, as in the scope of work, and pricing, ignore the legal stuff (no rich formatting, no break line):
+import os
 import sys
 import re
+import zlib
+import codecs
+from bisect import bisect_left, bisect_right
 import numpy as np
 import networkx as nx
 import community as community_louvain
-from sentence_transformers import SentenceTransformer
+from functools import lru_cache
 from sklearn.metrics.pairwise import cosine_similarity
 from itertools import chain
 from datetime import datetime
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+from summarizer.embedding_cache import EmbeddingCache
+model_name = "sentence-transformers/all-MiniLM-L6-v2"
 
 n = "03"
 folder_path = f"summarizer/rfp_test_samples/sample_{n}"
 
 length = 300 # for split passage
+# "sentence": passages end at a sentence end (or a space) near length and never inside a money amount
+# "fixed": a cut every length characters
+passage_split = "sentence"
+passage_overlap = 0 # characters repeated at the start of the next passage ("sentence" split only)
+# Repeated passages (boilerplate clauses, headers, amendment copies) are encoded and graphed once, with
+# a count standing in for the copies in the cluster centroids and percentiles
+dedup_passages = True
+dedup_similarity = 0.8 # estimated Jaccard similarity of word 3-grams above which passages are near-duplicates
+minhash_permutations = 64
+minhash_band_rows = 4 # rows per LSH band: passages sharing a band become candidate near-duplicates
 edge_percentile = 90 # to control minimum similarity required to connect nodes in graph
 aspect_percentile = 90
 title_weight=0.3
@@ -23,30 +38,80 @@ aspect_weight=0.3
 # np.percentile interpolates between values, so this may not correspond exactly to a strict top-X% by count
 centrality_percentile = 80
 pricing_percentile = 0
+graph_block_size = 1024 # rows of the similarity matrix computed at a time while building the graph
+threshold_bins = 4096 # histogram resolution used to locate the edge_percentile threshold
+# "percentile": link every pair above edge_percentile (all pairs, O(n^2))
+# "knn": link each passage to its knn_k most similar passages
+# "auto": percentile for small documents, knn from knn_auto_min_passages passages up
+graph_mode = "percentile"
+knn_k = 10
+knn_mutual = False # keep a knn edge only when both passages have each other as neighbors
+knn_auto_min_passages = 5000
+knn_exact_max_passages = 5000 # above this the knn search goes through an approximate IVF index
+ivf_nprobe = 8 # IVF lists searched per passage, more = closer to the exact knn but slower
+# Embedding backend (embedding_backends.py): "torch" (float32 SentenceTransformer), "torch-int8",
+# "onnx" or "onnx-int8" (ONNX Runtime). The int8 backends are faster on CPU-only hosts, see
+# benchmarks/embedding_backends.py for speed and summary agreement with "torch"
+embedding_backend = "torch"
+encode_threads = None # intra-op threads of the backend, None = library default (all cores)
+encode_batch_size = 32 # texts per forward pass when not scheduled
+# Encoding scheduler: texts sorted by length and cut into batches of at most encode_token_budget padded tokens,
+# so short passages go in large batches and long ones in small batches with little padding
+encode_scheduling = True
+encode_token_budget = None # padded tokens per forward pass, None = sized from the available memory
+encode_memory_fraction = 0.25 # share of the available memory one batch's activations may take
+encode_bytes_per_token = 64 * 1024 # rough float32 activation size per padded token for a MiniLM-size model
+encode_max_tokens = 256 # the model truncates longer texts (max_seq_length)
+encode_max_batch_size = 256
+use_embedding_cache = True # reuse embeddings of passages seen in earlier runs instead of re-encoding them
+embedding_cache_folder = "summarizer/embedding_cache"
+embedding_cache_max_rows = 200_000 # ~300 MB of float32 384-dim vectors
+# Other backends give slightly different vectors, so they get a cache of their own
+embedding_cache_name = model_name if embedding_backend == "torch" else f"{model_name}-{embedding_backend}"
+embedding_cache = EmbeddingCache(embedding_cache_folder, embedding_cache_name, embedding_cache_max_rows) if use_embedding_cache else None
 
 aspect_vectors_path = "summarizer/aspects/aspect_vectors.npz"
-data = np.load(aspect_vectors_path, allow_pickle=True)
-names = data["names"]
-vectors = data["vectors"]
-aspect_vectors = {name: vectors[i] for i, name in enumerate(names)}
-pricing_aspect_vector = np.load("summarizer/aspects/pricing_vector.npy")
+pricing_vector_path = "summarizer/aspects/pricing_vector.npy"
+
+# The model (torch) and aspect vectors are only loaded the first time they are needed,
+# so importing this module stays cheap
+@lru_cache(maxsize=None)
+def get_model():
+    from summarizer.embedding_backends import load_backend
+    return load_backend(embedding_backend, model_name, encode_threads, encode_batch_size)
+
+@lru_cache(maxsize=None)
+def get_aspect_vectors():
+    data = np.load(aspect_vectors_path, allow_pickle=True)
+    names = data["names"]
+    vectors = data["vectors"]
+    return {name: vectors[i] for i, name in enumerate(names)}
+
+@lru_cache(maxsize=None)
+def get_pricing_aspect_vector():
+    return np.load(pricing_vector_path)
+
+# normalize_text works on ASCII bytes in four C passes instead of seven passes over the str. Equivalent to,
+# step by step: drop invalid UTF-8 (lone surrogates), non-printable characters -> space, lowercase,
+# remove runs of 3+ repeated symbols, remove symbol-only clusters of 2+ chars between words, collapse
+# whitespace. How many spaces a step leaves does not change the later steps, so a run of non-ASCII
+# characters becomes one space while encoding, and controls a space in the same translate as the lowercasing
+def _non_ascii_to_space(error):
+    dropped = all("\ud800" <= ch <= "\udfff" for ch in error.object[error.start:error.end])
+    return ("" if dropped else " "), error.end
+
+codecs.register_error("normalize_text", _non_ascii_to_space)
+_ASCII_CLEANUP = bytes.maketrans(
+    bytes(range(0x20)) + b"\x7f" + b"ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+    b" " * 0x21 + b"abcdefghijklmnopqrstuvwxyz",
+)
+_SYMBOL_RUNS = re.compile(rb"([^\w\s])\1{2,}")
+_SYMBOL_CLUSTERS = re.compile(rb"\b[^\w\s]{2,}\b")
 
 def normalize_text(text):
-    # UTF-8 cleanup
-    text = text.encode("utf-8", "ignore").decode("utf-8", "ignore")
-    # Replace non-printable ASCII with space
-    text = re.sub(r"[^\x09\x0A\x0D\x20-\x7E]", " ", text)
-    # Flatten whitespace
-    text = re.sub(r"[\n\r\t]+", " ", text)
-    # Lowercase
-    text = text.lower()
-    # Step 1: Remove long runs of repeated non-alphanumeric symbols
-    text = re.sub(r"([^\w\s])\1{2,}", " ", text)
-    # Step 2: Remove symbol-only clusters longer than 2 chars
-    text = re.sub(r"\b[^\w\s]{2,}\b", " ", text)
-    # Step 3: Collapse multiple spaces
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
+    data = text.encode("ascii", "normalize_text").translate(_ASCII_CLEANUP)
+    data = _SYMBOL_CLUSTERS.sub(b" ", _SYMBOL_RUNS.sub(b" ", data))
+    return b" ".join(data.split()).decode("ascii")
 
 MONEY_REGEX = re.compile(
     r"""
@@ -59,8 +124,93 @@ MONEY_REGEX = re.compile(
     """,
     re.VERBOSE,
 )
+_MONEY_START = re.compile(r"\$|USD|usd") # where a MONEY_REGEX match can start
+
+def money_matches(text):
+    # (start, end) of the MONEY_REGEX matches in text, same as finditer. MONEY_REGEX has no literal prefix
+    # for re to scan for, so finditer tries the whole pattern at every position; here it only runs where
+    # an amount can start
+    matches = []
+    last_end = 0
+    for candidate in _MONEY_START.finditer(text):
+        if candidate.start() < last_end:
+            continue
+        match = MONEY_REGEX.match(text, candidate.start())
+        if match:
+            matches.append((match.start(), match.end()))
+            last_end = match.end()
+    return matches
+
+@lru_cache(maxsize=None)
+def get_token_budget():
+    if encode_token_budget is not None:
+        return encode_token_budget
+    try:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError): # no sysconf (Windows) or no SC_AVPHYS_PAGES (macOS)
+        return 64 * encode_max_tokens
+    budget = int(available * encode_memory_fraction // encode_bytes_per_token)
+    return min(max(budget, encode_max_tokens), encode_max_batch_size * encode_max_tokens)
+
+def _estimated_tokens(text):
+    # About 4 characters per wordpiece token in English, plus [CLS] / [SEP]
+    return min(len(text) // 4 + 2, encode_max_tokens)
+
+def encode_batches(texts, token_budget, max_batch_size=encode_max_batch_size):
+    # Lists of indexes into texts, longest texts first; a batch is full when another text would take it past
+    # token_budget padded tokens (batch size x its longest text) or past max_batch_size texts
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    batches = []
+    batch = []
+    longest = 0
+    for i in order:
+        if batch and ((len(batch) + 1) * longest > token_budget or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch = []
+        if not batch:
+            longest = _estimated_tokens(texts[i])
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+class ScheduledEncoder:
+    # Same encode call as the backends: one forward pass per encode_batches batch, results scattered
+    # back to the order of texts
+    def __init__(self, model, token_budget, max_batch_size=encode_max_batch_size):
+        self.model = model
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, show_progress_bar=False):
+        if isinstance(texts, str) or len(texts) == 0:
+            return self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=normalize_embeddings, show_progress_bar=False)
+        embeddings = None
+        for batch in encode_batches(texts, self.token_budget, self.max_batch_size):
+            batch_embeddings = self.model.encode(
+                [texts[i] for i in batch], batch_size=len(batch), convert_to_numpy=True,
+                normalize_embeddings=normalize_embeddings, show_progress_bar=False,
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+            embeddings[batch] = batch_embeddings
+        return embeddings
+
+def encode_texts(model, texts, normalize=False):
+    # model=None encodes with the default model, which is then only loaded if something is not cached
+    def load_model():
+        loaded = model if model is not None else get_model()
+        return ScheduledEncoder(loaded, get_token_budget()) if encode_scheduling else loaded
+
+    if embedding_cache is None:
+        return load_model().encode(texts, convert_to_numpy=True, normalize_embeddings=normalize, show_progress_bar=False)
+    return embedding_cache.encode(load_model, texts, normalize=normalize)
+
+def split_passages(text, length=length, overlap=passage_overlap):
+    if passage_split == "sentence":
+        spans, money_spans = passage_spans(text, length, overlap)
+        return [text[s:e] for s, e in spans], [text[s:e] for s, e in money_spans]
 
-def split_passages(text, length=length):
     passages = []
     money_passages = []
 
@@ -77,26 +227,296 @@ def split_passages(text, length=length):
 
     return passages, money_passages
 
-def build_similarity_graph_from_embeddings(embeddings, edge_percentile=edge_percentile): # The process of graph construction from embeddings
+_SENTENCE_END = re.compile(r"[.?!;] ")
+
+def passage_spans(text, length=length, overlap=0):
+    # (start, end) of the passages and of the money passages in text (normalized, so single spaces),
+    # without copying it. Money amounts are found in one pass over the whole text and assigned to the
+    # passage containing them; a passage never ends inside an amount
+    money = money_matches(text)
+    money_starts = [s for s, _ in money]
+    sentence_ends = [m.end() - 1 for m in _SENTENCE_END.finditer(text)] # the space after the punctuation
+    spans = []
+    money_spans = []
+    n = len(text)
+    start = 0
+    while start < n:
+        end = min(start + length, n)
+        if end < n:
+            # Last sentence end in the second half of the window, else the last space, else a hard cut
+            lo = start + length // 2
+            k = bisect_right(sentence_ends, end) - 1
+            if k >= 0 and sentence_ends[k] > lo:
+                end = sentence_ends[k]
+            else:
+                space = text.rfind(" ", lo, end)
+                if space != -1:
+                    end = space
+            i = bisect_right(money_starts, end - 1) - 1 # last amount starting before the cut
+            if i >= 0 and money[i][1] > end:
+                # Cut before the amount, or after it when it starts in the first half of the passage
+                end = money[i][0] if money[i][0] > start + length // 2 else money[i][1]
+
+        s, e = start, end
+        while s < e and text[s] == " ":
+            s += 1
+        while e > s and text[e - 1] == " ":
+            e -= 1
+        if s < e:
+            # Amounts do not overlap, so only the first one starting in the passage can end in it
+            j = bisect_left(money_starts, s)
+            if j < len(money) and money[j][1] <= e:
+                money_spans.append((s, e))
+            else:
+                spans.append((s, e))
+
+        if end >= n:
+            break
+        next_start = end
+        if overlap:
+            next_start = end - overlap
+            space = text.find(" ", next_start, end)
+            if space != -1:
+                next_start = space + 1 # start the overlap on a word
+        start = max(next_start, start + 1)
+
+    return spans, money_spans
+
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_rng = np.random.RandomState(0)
+_MINHASH_A = _minhash_rng.randint(1, 1 << 31, size=minhash_permutations).astype(np.uint64)
+_MINHASH_B = _minhash_rng.randint(0, 1 << 31, size=minhash_permutations).astype(np.uint64)
+
+def _minhash_signatures(passages, block=2000):
+    # One MinHash signature per passage over its word 3-grams (crc32, so signatures are the same in every
+    # process), minhash_permutations universal hashes at a time, block passages at a time to bound memory
+    signatures = np.empty((len(passages), minhash_permutations), dtype=np.uint64)
+    for start in range(0, len(passages), block):
+        hashes = []
+        offsets = []
+        for passage in passages[start:start + block]:
+            words = passage.split()
+            offsets.append(len(hashes))
+            hashes.extend(zlib.crc32(" ".join(words[i:i + 3]).encode("utf-8")) for i in range(max(1, len(words) - 2)))
+        values = (np.asarray(hashes, dtype=np.uint64)[:, None] * _MINHASH_A + _MINHASH_B) % _MINHASH_PRIME
+        signatures[start:start + len(offsets)] = np.minimum.reduceat(values, offsets, axis=0)
+    return signatures
+
+def deduplicate_passages(passages, near=True, similarity=dedup_similarity):
+    # Returns (kept passages, counts, exact duplicates dropped, near duplicates dropped). counts[i] is how
+    # many of the input passages kept passage i stands for; the first occurrence is kept.
+    # near=False only drops exact copies (money passages: an amended amount must not merge with the old one)
+    first = {}
+    kept = []
+    counts = []
+    for passage in passages:
+        i = first.get(passage)
+        if i is None:
+            first[passage] = len(kept)
+            kept.append(passage)
+            counts.append(1)
+        else:
+            counts[i] += 1
+    exact = len(passages) - len(kept)
+    if not near or len(kept) < 2:
+        return kept, np.asarray(counts, dtype=np.int64), exact, 0
+
+    # LSH: a passage is compared only with earlier representatives sharing one of its signature bands
+    signatures = _minhash_signatures(kept)
+    representative = np.arange(len(kept))
+    buckets = {}
+    for i in range(len(kept)):
+        keys = [(band, signatures[i, band:band + minhash_band_rows].tobytes()) for band in range(0, minhash_permutations, minhash_band_rows)]
+        for key in keys:
+            for j in buckets.get(key, ()):
+                if np.mean(signatures[i] == signatures[j]) >= similarity:
+                    representative[i] = j
+                    break
+            if representative[i] != i:
+                break
+        if representative[i] == i:
+            for key in keys:
+                buckets.setdefault(key, []).append(i)
+
+    merged = np.bincount(representative, weights=counts, minlength=len(kept)).astype(np.int64)
+    keep = np.flatnonzero(representative == np.arange(len(kept)))
+    return [kept[i] for i in keep], merged[keep], exact, len(kept) - len(keep)
+
+def _weighted_centroid(embeddings, weights=None):
+    if weights is None:
+        return np.mean(embeddings, axis=0, keepdims=True)
+    return np.average(embeddings, axis=0, weights=weights).reshape(1, -1)
+
+def _weighted_percentile(values, percentile, weights=None):
+    # np.percentile over values with each value repeated weights times
+    if weights is not None:
+        values = np.repeat(values, weights)
+    return np.percentile(values, percentile)
+
+def _unit_rows(embeddings):
+    embeddings = np.asarray(embeddings)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / norms
+
+def _similarity_strips(embeddings, block_size=graph_block_size):
+    # Yields (row offset, block) strips of the upper triangle of the cosine similarity matrix,
+    # block[r, c] being the similarity of passages start + r and start + c. Only block_size x n
+    # similarities are held in memory at once, never the full n x n matrix
+    unit = _unit_rows(embeddings)
+    n = len(unit)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = unit[start:stop] @ unit[start:].T
+        # Keep j > i only: zero out the diagonal and everything below it
+        block[np.tril_indices(stop - start, m=n - start)] = 0.0
+        yield start, block
+
+def similarity_edges(embeddings, edge_percentile=edge_percentile, block_size=graph_block_size):
+    # Returns (rows, cols, sims) for every pair i < j whose similarity is at or above the
+    # edge_percentile of all positive similarities, same as np.percentile on the full matrix.
+    # Pass 1 histograms the positive similarities to find the bin the percentile falls in,
+    # pass 2 only keeps pairs from that bin upwards and picks the exact threshold among them
+    counts = np.zeros(threshold_bins, dtype=np.int64)
+    for _, block in _similarity_strips(embeddings, block_size):
+        valid = block[block > 0]
+        bins = np.minimum((valid * threshold_bins).astype(np.int64), threshold_bins - 1)
+        counts += np.bincount(bins, minlength=threshold_bins)
+
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+    rank = (total - 1) * edge_percentile / 100
+    lo, hi = int(np.floor(rank)), int(np.ceil(rank))
+    cumulative = np.cumsum(counts)
+    first_bin = int(np.searchsorted(cumulative, lo, side="right"))
+    below = int(cumulative[first_bin - 1]) if first_bin > 0 else 0
+
+    rows, cols, sims = [], [], []
+    for start, block in _similarity_strips(embeddings, block_size):
+        r, c = np.nonzero((block > 0) & (block * threshold_bins >= first_bin))
+        sims.append(block[r, c])
+        rows.append((r + start).astype(np.int32))
+        cols.append((c + start).astype(np.int32))
+    rows, cols, sims = np.concatenate(rows), np.concatenate(cols), np.concatenate(sims)
+
+    # Linear interpolation between the two closest ranks, like np.percentile's default method
+    kth = np.partition(sims, [lo - below, hi - below])
+    low_value, high_value = kth[lo - below], kth[hi - below]
+    threshold = low_value + (high_value - low_value) * (rank - lo)
+
+    keep = sims >= threshold
+    return rows[keep], cols[keep], sims[keep]
+
+def _exact_top_k(unit, k, block_size=graph_block_size):
+    # Brute force top-k by strips of block_size queries, exact but O(n^2)
+    n = len(unit)
+    neighbors = np.empty((n, k), dtype=np.int64)
+    sims = np.empty((n, k), dtype=unit.dtype)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = unit[start:stop] @ unit.T
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf # never your own neighbor
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        neighbors[start:stop] = top
+        sims[start:stop] = np.take_along_axis(block, top, axis=1)
+    return neighbors, sims
+
+def _spherical_kmeans(unit, n_clusters, iterations=10, seed=0):
+    # k-means on the unit sphere (cosine), trained on a sample: only used to partition passages into IVF lists
+    rng = np.random.default_rng(seed)
+    sample = unit[rng.choice(len(unit), size=min(len(unit), n_clusters * 64), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=n_clusters, replace=False)]
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty clusters keep their previous centroid
+        centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1), centroids)
+    return centroids
+
+def _ivf_top_k(unit, k, nprobe=ivf_nprobe, block_size=graph_block_size):
+    # Approximate top-k with an inverted file index: passages are bucketed by their nearest of sqrt(n)
+    # centroids and each passage is only compared against the nprobe buckets closest to it,
+    # about n * nprobe * sqrt(n) similarities instead of n^2
+    n = len(unit)
+    n_lists = max(1, int(np.sqrt(n)))
+    nprobe = min(nprobe, n_lists)
+    centroids = _spherical_kmeans(unit, n_lists)
+
+    to_centroids = unit @ centroids.T
+    home = np.argmax(to_centroids, axis=1)
+    probes = np.argpartition(-to_centroids, nprobe - 1, axis=1)[:, :nprobe]
+
+    order = np.argsort(home, kind="stable")
+    bounds = np.searchsorted(home[order], np.arange(n_lists + 1))
+    # Inverse of probes: which passages search each list
+    probe_order = np.argsort(probes.ravel(), kind="stable")
+    probe_bounds = np.searchsorted(probes.ravel()[probe_order], np.arange(n_lists + 1))
+    probe_queries = probe_order // nprobe
+
+    # Slots that stay at -1 / -inf (fewer than k candidates) are dropped when building edges
+    neighbors = np.full((n, k), -1, dtype=np.int64)
+    sims = np.full((n, k), -np.inf, dtype=unit.dtype)
+    for list_id in range(n_lists):
+        members = order[bounds[list_id]:bounds[list_id + 1]]
+        searching = probe_queries[probe_bounds[list_id]:probe_bounds[list_id + 1]]
+        for start in range(0, len(searching), block_size):
+            queries = searching[start:start + block_size]
+            block = unit[queries] @ unit[members].T
+            block[queries[:, None] == members[None, :]] = -np.inf # never your own neighbor
+
+            # Merge this list's candidates into the best k found so far
+            merged_ids = np.concatenate([neighbors[queries], np.broadcast_to(members, block.shape)], axis=1)
+            merged_sims = np.concatenate([sims[queries], block], axis=1)
+            top = np.argpartition(-merged_sims, k - 1, axis=1)[:, :k]
+            neighbors[queries] = np.take_along_axis(merged_ids, top, axis=1)
+            sims[queries] = np.take_along_axis(merged_sims, top, axis=1)
+    return neighbors, sims
+
+def knn_edges(embeddings, k=knn_k, mutual=knn_mutual, nprobe=ivf_nprobe):
+    # Returns (rows, cols, sims) with rows < cols for the knn graph: i-j is an edge when j is among the
+    # k most similar passages of i (or i of j). With mutual=True both have to hold.
+    # Only positive similarities become edges, same as the percentile graph
+    unit = _unit_rows(embeddings)
+    n = len(unit)
+    k = min(k, n - 1)
+    if k < 1:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+    if n <= knn_exact_max_passages:
+        neighbors, sims = _exact_top_k(unit, k)
+    else:
+        neighbors, sims = _ivf_top_k(unit, k, nprobe)
+
+    rows = np.repeat(np.arange(n), k)
+    cols = neighbors.ravel()
+    sims = sims.ravel()
+    valid = (cols >= 0) & (sims > 0)
+    rows, cols, sims = rows[valid], cols[valid], sims[valid]
+
+    # Each undirected pair shows up once per direction it was found in; the key sorts pairs row-major
+    lo, hi = np.minimum(rows, cols), np.maximum(rows, cols)
+    _, first, found = np.unique(lo * n + hi, return_index=True, return_counts=True)
+    if mutual:
+        first = first[found == 2]
+    return lo[first].astype(np.int32), hi[first].astype(np.int32), sims[first]
+
+def build_similarity_graph_from_embeddings(embeddings, edge_percentile=edge_percentile, graph_mode=graph_mode): # The process of graph construction from embeddings
     n = len(embeddings)
     G = nx.Graph()
     G.add_nodes_from(range(n))
-    
-    sim_matrix = np.dot(embeddings, embeddings.T)
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    sim_matrix /= (norms @ norms.T)
-    np.fill_diagonal(sim_matrix, 0.0)
-    
-    triu = sim_matrix[np.triu_indices(n, k=1)]
-    valid = triu[triu > 0]
-    if valid.size == 0:
-        return G
-    
-    threshold = np.percentile(valid, edge_percentile)
-    for i in range(n):
-        for j in range(i+1, n):
-            if sim_matrix[i, j] >= threshold:
-                G.add_edge(i, j, weight=float(sim_matrix[i, j]))
+
+    if graph_mode == "auto":
+        graph_mode = "knn" if n >= knn_auto_min_passages else "percentile"
+    if graph_mode == "knn":
+        rows, cols, sims = knn_edges(embeddings)
+    elif graph_mode == "percentile":
+        rows, cols, sims = similarity_edges(embeddings, edge_percentile)
+    else:
+        raise ValueError(f"Unknown graph_mode: {graph_mode}")
+    G.add_weighted_edges_from(zip(rows.tolist(), cols.tolist(), sims.tolist()))
     return G
 
 def cluster_graph(G): # The process of clustering the nodes (the embeddings) based on cosine similarity
@@ -112,7 +532,7 @@ def cluster_graph(G): # The process of clustering the nodes (the embeddings) bas
 
     return clusters_list
 
-def summarize_clusters(passages, embeddings, clusters, centrality_percentile=centrality_percentile):
+def summarize_clusters(passages, embeddings, clusters, centrality_percentile=centrality_percentile, counts=None):
     centrality_summary = []
     total_central_passages = 0
 
@@ -122,11 +542,12 @@ def summarize_clusters(passages, embeddings, clusters, centrality_percentile=cen
 
         cluster_passages = [passages[i] for i in cluster]
         cluster_embeds = embeddings[cluster]
+        cluster_counts = counts[cluster] if counts is not None else None
 
         # --- Semantic centrality ---
-        centroid = np.mean(cluster_embeds, axis=0, keepdims=True)
+        centroid = _weighted_centroid(cluster_embeds, cluster_counts)
         sims = cosine_similarity(cluster_embeds, centroid).reshape(-1)
-        thresh = np.percentile(sims, centrality_percentile)
+        thresh = _weighted_percentile(sims, centrality_percentile, cluster_counts)
         central_idxs = [i for i, s in enumerate(sims) if s >= thresh]
 
         total_central_passages += len(central_idxs)
@@ -136,13 +557,13 @@ def summarize_clusters(passages, embeddings, clusters, centrality_percentile=cen
     
     return centrality_summary, total_central_passages
 
-def summarize_pricing(passages, embeddings, pricing_percentile=pricing_percentile):
+def summarize_pricing(passages, embeddings, pricing_percentile=pricing_percentile, counts=None):
     pricing_summary = []
     total_central_passages = 0
 
-    centroid = np.mean(embeddings, axis=0, keepdims=True)
+    centroid = _weighted_centroid(embeddings, counts)
     sims = cosine_similarity(embeddings, centroid).reshape(-1)
-    thresh = np.percentile(sims, pricing_percentile)
+    thresh = _weighted_percentile(sims, pricing_percentile, counts)
     central_idxs = [i for i, s in enumerate(sims) if s >= thresh]
 
     total_central_passages += len(central_idxs)
@@ -152,7 +573,7 @@ def summarize_pricing(passages, embeddings, pricing_percentile=pricing_percentil
         
     return total_central_passages, pricing_summary
 
-def select_clusters_based_on_aspect(embeddings,clusters_list,aspect_vectors,title_vector, description_vector, aspect_percentile,title_weight,description_weight,aspect_weight):
+def select_clusters_based_on_aspect(embeddings,clusters_list,aspect_vectors,title_vector, description_vector, aspect_percentile,title_weight,description_weight,aspect_weight, counts=None):
     cluster_scores = []
 
     # Stack centroid vectors (one per aspect)
@@ -162,7 +583,7 @@ def select_clusters_based_on_aspect(embeddings,clusters_list,aspect_vectors,titl
         if len(cluster) == 0: continue
 
         cluster_embeds = embeddings[cluster]             # (n, dim)
-        cluster_centroid = np.mean(cluster_embeds, axis=0, keepdims=True)  # (1, dim)
+        cluster_centroid = _weighted_centroid(cluster_embeds, counts[cluster] if counts is not None else None)  # (1, dim)
 
         # Similarity to title centroid
         sim_to_title = cosine_similarity(
@@ -199,29 +620,51 @@ def select_clusters_based_on_aspect(embeddings,clusters_list,aspect_vectors,titl
 
     return selected_clusters
 
-def summarize_rfp(text, model, title_vector, description_vector, title_weight, description_weight, aspect_weight):
+def summarize_rfp(text, model, title_vector, description_vector, title_weight, description_weight, aspect_weight, graph_mode=graph_mode):
     if not text:
         return "No Text Input"
     text = normalize_text(text)
     passages, money_passages = split_passages(text)
-    money_text = "\n".join(money_passages)
     if not passages or not money_passages:
         return "No Passages found"
-    embeddings = model.encode(passages, convert_to_numpy=True, show_progress_bar=False)
-    pricing_embeddings = model.encode(money_passages, convert_to_numpy=True, show_progress_bar=False)
-    G = build_similarity_graph_from_embeddings(embeddings)
+    passages, counts, money_passages, money_counts = deduplicate(passages, money_passages)
+    # One encode call for both lists, so the scheduler batches them together
+    all_embeddings = encode_texts(model, passages + money_passages)
+    embeddings, pricing_embeddings = all_embeddings[:len(passages)], all_embeddings[len(passages):]
+    if embedding_cache is not None:
+        print(f"Embedding cache: {embedding_cache.hits} hits | {embedding_cache.misses} misses so far")
+
+    return summarize_passages(len(text), passages, money_passages, embeddings, pricing_embeddings, title_vector, description_vector, title_weight, description_weight, aspect_weight, graph_mode, counts, money_counts)
+
+def deduplicate(passages, money_passages):
+    # (passages, counts, money_passages, money_counts) with repeated passages dropped when dedup_passages
+    # is on; counts are None otherwise
+    if not dedup_passages:
+        return passages, None, money_passages, None
+    total, money_total = len(passages), len(money_passages)
+    passages, counts, exact, near = deduplicate_passages(passages)
+    money_passages, money_counts, money_exact, _ = deduplicate_passages(money_passages, near=False)
+    print(f"Dedup: {total} passages >>> {len(passages)} ({exact} exact, {near} near duplicates) | "
+          f"{money_total} money_passages >>> {len(money_passages)} ({money_exact} exact duplicates)")
+    return passages, counts, money_passages, money_counts
+
+def summarize_passages(text_length, passages, money_passages, embeddings, pricing_embeddings, title_vector, description_vector, title_weight, description_weight, aspect_weight, graph_mode=graph_mode, counts=None, money_counts=None):
+    # Everything after encoding: graph, clusters, selection. Only needs numpy arrays, no model.
+    # counts / money_counts: how many split passages each passage stands for after deduplicate
+    money_text = "\n".join(money_passages)
+    G = build_similarity_graph_from_embeddings(embeddings, graph_mode=graph_mode)
     if G.number_of_edges() > 0: # Meaning no nodes (passages) were semantically similar, so no connections between nodes (edges) were formed
         clusters = cluster_graph(G)
     else: return "Number of edges = 0"
     if not clusters: return "No clusters found"
     
-    relevant_clusters = select_clusters_based_on_aspect(embeddings,clusters,aspect_vectors,title_vector, description_vector, aspect_percentile,title_weight,description_weight,aspect_weight)
+    relevant_clusters = select_clusters_based_on_aspect(embeddings,clusters,get_aspect_vectors(),title_vector, description_vector, aspect_percentile,title_weight,description_weight,aspect_weight, counts)
 
-    summary, total_central_passages = summarize_clusters(passages, embeddings, relevant_clusters)
+    summary, total_central_passages = summarize_clusters(passages, embeddings, relevant_clusters, counts=counts)
     summary_length = sum(len(c) for c in summary)
-    print(f"\nText size = {len(text)} chars >>> {len(passages)} passages >>> retreived {total_central_passages} passages ({summary_length} chars)")
+    print(f"\nText size = {text_length} chars >>> {len(passages)} passages >>> retreived {total_central_passages} passages ({summary_length} chars)")
 
-    pricing_total_central_passages, pricing_summary = summarize_pricing(money_passages, pricing_embeddings)
+    pricing_total_central_passages, pricing_summary = summarize_pricing(money_passages, pricing_embeddings, counts=money_counts)
 #output, total_chars
     flat_centrality = list(chain.from_iterable(summary)) if any(isinstance(i, list) for i in summary) else summary
     flat_pricing_centrality = list(chain.from_iterable(pricing_summary)) if any(isinstance(i, list) for i in pricing_summary) else pricing_summary
@@ -231,6 +674,15 @@ def summarize_rfp(text, model, title_vector, description_vector, title_weight, d
 
     return centrality_text
 
+def summary_weights(description):
+    # (title_weight, description_weight, aspect_weight): the description dominates when there is one
+    if description is not None:
+        return 0.3, 4, 0.3
+    return 0.5, 0, 0.5
+
+def format_summary(description, summary):
+    return f"Description:{description}\n\n----------------------------------------------\n\n{summary}"
+
 if __name__ == "__main__":
     title_file = f"{folder_path}/title.txt"
     summary_output = f"{folder_path}/summary.txt"
@@ -239,6 +691,7 @@ if __name__ == "__main__":
     with open(title_file, "r", encoding="utf-8") as r:
         title = r.read()
         
+    model = get_model()
     title_vector = model.encode(title, normalize_embeddings=True)
     with open(sample_input, "r", encoding="utf-8") as r:
         text = r.read()
@@ -268,26 +721,17 @@ if __name__ == "__main__":
     sys.stdout = sys.__stdout__
     log_f.close()
 
-def summarize(full_text, title, description):
-    title_vector = model.encode(title, normalize_embeddings=True)
-    if description is not None:
-        description_vector = model.encode(description, normalize_embeddings=True)
-        title_weight=0.3
-        description_weight = 4
-        aspect_weight=0.3
-    else:
-        description_vector = None
-        title_weight=0.5
-        description_weight = 0
-        aspect_weight=0.5
+def summarize(full_text, title, description, graph_mode=graph_mode):
+    # Same steps as summarize_rfp, but the title, description and passages go through one encode call
+    from summarizer.pipeline import prepare_document, encode_jobs, summarize_job
+    title_weight, description_weight, aspect_weight = summary_weights(description)
 
     print(f"RUN {folder_path}| Timestamp: {datetime.now()}")
-    print(f"Passage Length: {len} | Edge%={edge_percentile} | Centrality%={centrality_percentile} | Aspect%={aspect_percentile} | Pricing%={pricing_percentile} | TItle weight={title_weight} | Description weight={description_weight} | Aspect weight={aspect_weight}")
+    print(f"Passage Length: {len} | Graph={graph_mode} | Edge%={edge_percentile} | Centrality%={centrality_percentile} | Aspect%={aspect_percentile} | Pricing%={pricing_percentile} | TItle weight={title_weight} | Description weight={description_weight} | Aspect weight={aspect_weight}")
 
-    summary = summarize_rfp(full_text, model, title_vector, description_vector, title_weight, description_weight, aspect_weight)    
-    summary = f"Description:{description}\n\n----------------------------------------------\n\n{summary}"
-    print(f"\nSummary length: {len(summary)} chars")    
+    job = prepare_document(full_text, title, description)
+    encode_jobs([job])
+    summary = summarize_job(job, graph_mode)
     print("Comments:\n\n\n")
 
     return summary
-